@@ -1,49 +1,58 @@
 import os
 import json
 import csv
+import time
+import threading
 import langchain
 import pinecone
 import pandas as pd
 from datetime import datetime
-from pinecone import Pinecone, ServerlessSpec
-from langchain_pinecone import PineconeVectorStore
+from collections import OrderedDict
+from pinecone import Pinecone
 from langchain.schema import AIMessage, HumanMessage
-from langchain.chains import RetrievalQA
-from langchain.memory import ConversationBufferMemory
-from langchain_openai import OpenAIEmbeddings
-from langchain_openai import ChatOpenAI
+from langchain_core.messages import get_buffer_string
 from langchain_core.prompts import PromptTemplate
 from dotenv import load_dotenv, find_dotenv
+from resilience import Deadline, DeadlineExceeded, CircuitOpenError, breaker_from_env
+from model_router import router_from_env
+from embedding_space import SpaceResolver, default_space_config
+import tracing
 
 _ = load_dotenv(find_dotenv())
-openai_api_key = os.getenv("OPENAI_API_KEY")
-embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key)
+
+# Time budgets (seconds) for a whole predict call and for each external dependency
+PREDICT_DEADLINE_SECONDS = float(os.getenv("PREDICT_DEADLINE_SECONDS", "30"))
+HISTORY_TIMEOUT_SECONDS = float(os.getenv("HISTORY_TIMEOUT_SECONDS", "3"))
+RETRIEVAL_TIMEOUT_SECONDS = float(os.getenv("RETRIEVAL_TIMEOUT_SECONDS", "5"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "20"))
+EMBEDDING_TIMEOUT_SECONDS = float(os.getenv("EMBEDDING_TIMEOUT_SECONDS", "5"))
+STORE_TIMEOUT_SECONDS = float(os.getenv("STORE_TIMEOUT_SECONDS", "5"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+
+# How long a user's loaded chat history is reused before Pinecone is queried again.
+# Entries are kept in write order; expired ones and the oldest beyond
+# HISTORY_CACHE_SIZE users are evicted on every write
+HISTORY_CACHE_SECONDS = float(os.getenv("HISTORY_CACHE_SECONDS", "300"))
+HISTORY_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", "1000"))
+_history_cache = OrderedDict()
+_history_cache_lock = threading.Lock()
+_clients_warm = threading.Event()
+
+# One breaker per dependency so a degraded service stops being called for a while
+# (chat models get one breaker each inside the model router)
+history_breaker = breaker_from_env("pinecone-history", "HISTORY")
+retrieval_breaker = breaker_from_env("pinecone-retrieval", "RETRIEVAL")
+store_breaker = breaker_from_env("pinecone-store", "STORE")
+embedding_breaker = breaker_from_env("openai-embeddings", "EMBEDDING")
 
 # Initialize Pinecone
 pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
 
-# Create index if it doesn't exist
-index_name = os.getenv("PINECONE_INDEX_NAME")
-try:
-    # Try to get the index first
-    index = pc.Index(index_name)
-    print(f"Connected to existing Pinecone index: {index_name}")
-except Exception as e:
-    # If index doesn't exist, create it
-    print(f"Creating new Pinecone index: {index_name}")
-    pc.create_index(
-        name=index_name,
-        spec=ServerlessSpec(
-            cloud="aws",
-            region="us-east-1"
-        ),
-        dimension=1536,  # dimensionality of text-embedding-ada-002
-        metric='cosine'
-    )
-    index = pc.Index(index_name)
+# Embedding model and index to read from / write to, following any running migration
+spaces = SpaceResolver(pc, default_space_config(), timeout=EMBEDDING_TIMEOUT_SECONDS)
+spaces.read_space()  # connect to (or create) the index at startup
 
-llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
-vector_store = PineconeVectorStore(index, embeddings, "text")
+router = router_from_env(LLM_TIMEOUT_SECONDS)
 
 template = """
 You are a helpful AI assistant. Use the following context (delimited by <ctx></ctx>) and the chat history (delimited by <hs></hs>) to answer the question:
@@ -101,8 +110,32 @@ def register_user(name: str):
     except Exception as e:
         return False, f"Registration failed: {str(e)}"
 
-def get_user_chat_history(user_id):
-    """Retrieve user chat history from pinecone"""
+def _cached_history(user_id):
+    """Return a copy of the user's cached history, or None when there is no fresh entry"""
+    with _history_cache_lock:
+        cached = _history_cache.get(user_id)
+        if cached and time.monotonic() - cached[0] < HISTORY_CACHE_SECONDS:
+            return list(cached[1])
+    return None
+
+def _cache_history(user_id, history):
+    now = time.monotonic()
+    with _history_cache_lock:
+        _history_cache[user_id] = (now, list(history))
+        _history_cache.move_to_end(user_id)
+        while _history_cache:
+            oldest_user, (cached_at, _) = next(iter(_history_cache.items()))
+            if now - cached_at < HISTORY_CACHE_SECONDS and len(_history_cache) <= HISTORY_CACHE_SIZE:
+                break
+            del _history_cache[oldest_user]
+
+def clear_user_history_cache(user_id):
+    """Drop the user's cached history, e.g. on logout"""
+    with _history_cache_lock:
+        _history_cache.pop(user_id, None)
+
+def get_user_chat_history(user_id, timeout=HISTORY_TIMEOUT_SECONDS, use_cache=True):
+    """Retrieve user chat history from pinecone, giving up after timeout seconds"""
     try:
         print(f"Retrieving chat history for user: {user_id}")
         
@@ -110,18 +143,29 @@ def get_user_chat_history(user_id):
         if not user_id:
             print("Warning: Empty user_id provided to get_user_chat_history")
             return []
+
+        if use_cache:
+            cached = _cached_history(user_id)
+            if cached is not None:
+                print(f"Using cached chat history for user: {user_id}")
+                return cached
         
         # Query Pinecone for user's chat history
-        results = index.query(
-            vector=[0] * 1536,  # Dummy vector for metadata filtering
+        space = spaces.read_space()
+        results = history_breaker.call(
+            space.index.query,
+            vector=[0] * space.dimension,  # Dummy vector for metadata filtering
             filter={"user_id": user_id},
             top_k=1000,
-            include_metadata=True
+            include_metadata=True,
+            _request_timeout=timeout,
+            timeout=timeout
         )
         
         # Check if we got any results
         if not results.matches:
             print(f"No chat history found for user: {user_id}")
+            _cache_history(user_id, [])
             return []
             
         print(f"Retrieved {len(results.matches)} history items for user: {user_id}")
@@ -145,13 +189,15 @@ def get_user_chat_history(user_id):
         except Exception as sorting_error:
             print(f"Error sorting history: {sorting_error}")
             
+        _cache_history(user_id, history)
         return history
     except Exception as e:
         print(f"Error retrieving chat history for user {user_id}: {e}")
         return []
 
-def store_chat_in_pinecone(user_id, human_message, ai_message):
-    """Store user chats in pinecone"""
+def store_chat_in_pinecone(user_id, human_message, ai_message, timeout=STORE_TIMEOUT_SECONDS):
+    """Store user chats in pinecone, giving up after timeout seconds"""
+    deadline = Deadline(timeout)
     try:
         # Validate inputs
         if not user_id:
@@ -168,9 +214,6 @@ def store_chat_in_pinecone(user_id, human_message, ai_message):
         
         print(f"Storing chat for user {user_id} with ID {unique_id}")
         
-        # Create the vector from the human message
-        vector = embeddings.embed_query(human_message)
-
         # Prepare metadata
         metadata = {
             "user_id": user_id,
@@ -179,23 +222,119 @@ def store_chat_in_pinecone(user_id, human_message, ai_message):
             "ai_message": ai_message,
         }
 
-        # Upsert the data into Pinecone
-        index.upsert(
-            vectors=[
-                {
-                    "id": unique_id,
-                    "values": vector,
-                    "metadata": metadata
-                }
-            ]
-        )
+        # During an embedding migration the chat is written to both indexes;
+        # only a failure on the index being read from counts as a failed store
+        for position, space in enumerate(spaces.write_spaces()):
+            try:
+                # Create the vector from the human message
+                vector = embedding_breaker.call(
+                    space.embeddings.embed_query,
+                    human_message,
+                    timeout=deadline.budget(EMBEDDING_TIMEOUT_SECONDS)
+                )
+
+                # Upsert the data into Pinecone
+                budget = deadline.budget(STORE_TIMEOUT_SECONDS)
+                store_breaker.call(
+                    space.index.upsert,
+                    vectors=[
+                        {
+                            "id": unique_id,
+                            "values": vector,
+                            "metadata": metadata
+                        }
+                    ],
+                    _request_timeout=budget,
+                    timeout=budget
+                )
+            except Exception as e:
+                if position == 0:
+                    raise
+                print(f"Error dual-writing chat to index {space.name}: {e}")
         
         print(f"Successfully stored chat in Pinecone with ID: {unique_id}")
+
+        # Keep a cached history in step with what is now stored
+        with _history_cache_lock:
+            cached = _history_cache.get(user_id)
+            if cached:
+                cached[1].extend([HumanMessage(content=human_message), AIMessage(content=ai_message)])
     except Exception as e:
         print(f"Error storing chat in Pinecone: {e}")
 
-def predict(message, history, user_id):
-    """Handles user input, retrieves previous chat history, and generates a response using LangChain."""
+def warm_up_clients():
+    """Open the OpenAI and Pinecone connections and load the tokenizer once per process"""
+    if _clients_warm.is_set():
+        return
+    try:
+        space = spaces.read_space()
+        space.embeddings.embed_query("warm-up")
+        space.index.describe_index_stats()
+        router.count_tokens("warm-up", router.endpoints[0].name)
+        _clients_warm.set()
+        print("Clients warmed up")
+    except Exception as e:
+        print(f"Client warm-up failed: {e}")
+
+def prefetch_user_history(user_id):
+    """Load the user's chat history into the cache ahead of their first message"""
+    return get_user_chat_history(user_id, use_cache=False)
+
+def retrieve_context(message, timeout=RETRIEVAL_TIMEOUT_SECONDS):
+    """Retrieve knowledge documents for the message, returning no context if the vector store is slow or down"""
+    try:
+        docs = retrieval_breaker.call(
+            spaces.read_space().vector_store.similarity_search,
+            message,
+            k=RETRIEVAL_TOP_K,
+            timeout=timeout
+        )
+        print(f"Retrieved {len(docs)} context documents")
+        return "\n\n".join(doc.page_content for doc in docs)
+    except Exception as e:
+        print(f"Retrieval unavailable, answering without context: {e}")
+        tracing.record(retrieval_fallback=True)
+        return ""
+
+def retrieve_context_by_vector(embedding, timeout=RETRIEVAL_TIMEOUT_SECONDS, space=None):
+    """Retrieve knowledge context for an already computed query embedding; errors are raised.
+
+    Pass the space the embedding was made with, so a migration switch in between cannot mix them.
+    """
+    space = space or spaces.read_space()
+    docs = retrieval_breaker.call(
+        space.vector_store.similarity_search_by_vector,
+        embedding,
+        k=RETRIEVAL_TOP_K,
+        timeout=timeout
+    )
+    return "\n\n".join(doc.page_content for doc in docs)
+
+def format_prompt(message, context, full_history):
+    """Fill the prompt template with the context and chat history"""
+    return prompt.format(
+        context=context,
+        history=get_buffer_string(full_history),
+        question=message
+    )
+
+def generate_answer(message, context, full_history, timeout=LLM_TIMEOUT_SECONDS):
+    """Fill the prompt template and ask the routed LLM for an answer"""
+    return router.invoke(format_prompt(message, context, full_history), message, timeout=timeout)
+
+def predict(message, history, user_id, deadline=None, context=None):
+    """Handles user input, retrieves previous chat history, and generates a response using LangChain.
+
+    All external calls share the deadline; when a dependency is slow the answer
+    is produced without that dependency instead of stalling the request.
+    A context retrieved ahead of time (see speculative.py) skips the retrieval step.
+    """
+    with tracing.trace_request(message, user_id):
+        return _predict(message, history, user_id, deadline, context)
+
+def _predict(message, history, user_id, deadline, context):
+    if deadline is None:
+        deadline = Deadline(PREDICT_DEADLINE_SECONDS)
     try:
         print(f"Processing message for user: {user_id}")
         
@@ -217,7 +356,11 @@ def predict(message, history, user_id):
             current_history.append(AIMessage(content=ai))
         
         # Get previous history from Pinecone
-        previous_history = get_user_chat_history(user_id)
+        with tracing.stage("history"):
+            previous_history = get_user_chat_history(
+                user_id, timeout=deadline.budget(HISTORY_TIMEOUT_SECONDS)
+            )
+        tracing.record_content("history", [{"type": m.type, "content": m.content} for m in previous_history])
         
         # Log history information for debugging
         print(f"Current session history length: {len(current_history)} messages")
@@ -230,40 +373,43 @@ def predict(message, history, user_id):
         full_history.extend(current_history)
         full_history.append(HumanMessage(content=message))
 
-        # Create memory from the combined history
-        memory = ConversationBufferMemory(
-            memory_key="history",
-            input_key="question"
-        )
-        memory.chat_memory.messages = full_history
-
-        # Create QA system
-        qa = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=vector_store.as_retriever(),
-            chain_type_kwargs={
-                "verbose": True,
-                "prompt": prompt,
-                "memory": memory
-            },
-        )
+        # Retrieve knowledge context for the question
+        if context is None:
+            with tracing.stage("retrieval"):
+                context = retrieve_context(message, timeout=deadline.budget(RETRIEVAL_TIMEOUT_SECONDS))
+        elif context:
+            print("Using prefetched context")
+            tracing.record(speculative_hit=True)
+        tracing.record_content("context", context)
 
         # Generate the response
         print(f"Generating answer for: '{message[:50]}...'")
-        answer = qa.run(message)
+        with tracing.stage("generation"):
+            answer = generate_answer(
+                message, context, full_history, timeout=deadline.budget(LLM_TIMEOUT_SECONDS)
+            )
+        tracing.record_content("answer", answer)
         print(f"Generated answer: '{answer[:50]}...'")
         
         # Store the interaction in Pinecone for future reference
         print("Storing chat in Pinecone...")
-        store_chat_in_pinecone(user_id, message, answer)
+        with tracing.stage("store"):
+            store_chat_in_pinecone(user_id, message, answer, timeout=deadline.budget(STORE_TIMEOUT_SECONDS))
 
         # Update Gradio's history with the new interaction
         history.append((message, answer))
         return history, history
         
+    except (DeadlineExceeded, CircuitOpenError) as e:
+        print(f"Answer generation unavailable: {str(e)}")
+        tracing.record(error=f"{type(e).__name__}: {e}")
+        error_message = "The assistant is busy right now. Please try again in a moment."
+        history.append((message, error_message))
+        return history, history
+
     except Exception as e:
         print(f"Error in predict function: {str(e)}")
+        tracing.record(error=f"{type(e).__name__}: {e}")
         error_message = f"Error generating response: {str(e)}"
         history.append((message, error_message))
         return history, history
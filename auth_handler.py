@@ -1,8 +1,12 @@
 from typing import Tuple, Optional, Dict
 import json
+import time
+import threading
 import requests
 import os
+from collections import OrderedDict
 from dotenv import load_dotenv
+from resilience import CircuitOpenError, breaker_from_env
 
 load_dotenv()
 
@@ -21,6 +25,23 @@ class AuthHandler:
             "Content-Type": "application/json",
             "Accept": "application/json"
         }
+
+        # (connect, read) timeouts for every Kratos request
+        self.timeout = (
+            float(os.getenv("AUTH_CONNECT_TIMEOUT_SECONDS", "2")),
+            float(os.getenv("AUTH_TIMEOUT_SECONDS", "5"))
+        )
+        self.breaker = breaker_from_env("kratos", "AUTH")
+
+        # Last successful validation per token. Fresh entries skip the whoami call,
+        # older ones are still used when Kratos is unavailable. Entries are kept in
+        # write order so expired ones (and the oldest beyond the size cap) are
+        # evicted from the front on every write
+        self.session_cache_seconds = float(os.getenv("AUTH_SESSION_CACHE_SECONDS", "60"))
+        self.stale_session_seconds = float(os.getenv("AUTH_STALE_SESSION_SECONDS", "300"))
+        self.session_cache_size = int(os.getenv("AUTH_SESSION_CACHE_SIZE", "10000"))
+        self._session_cache = OrderedDict()
+        self._session_cache_lock = threading.Lock()
         
         # Print initialization info for debugging
         print(f"Initialized AuthHandler with base URL: {self.base_url}")
@@ -33,7 +54,7 @@ class AuthHandler:
         try:
             # Initialize login flow
             print(f"Initializing login flow for {email}")
-            response = requests.get(f"{self.base_url}/self-service/login/api", headers=self.headers)
+            response = requests.get(f"{self.base_url}/self-service/login/api", headers=self.headers, timeout=self.timeout)
             response.raise_for_status()
             flow_data = response.json()
             flow_id = flow_data.get('id')
@@ -55,7 +76,8 @@ class AuthHandler:
             login_response = requests.post(
                 f"{self.base_url}/self-service/login?flow={flow_id}", 
                 json=login_payload,
-                headers=self.headers
+                headers=self.headers,
+                timeout=self.timeout
             )
             
             print(f"Login response status: {login_response.status_code}")
@@ -99,7 +121,7 @@ class AuthHandler:
         try:
             # Initialize registration flow
             print(f"Initializing registration flow for {email}")
-            response = requests.get(f"{self.base_url}/self-service/registration/api", headers=self.headers)
+            response = requests.get(f"{self.base_url}/self-service/registration/api", headers=self.headers, timeout=self.timeout)
             response.raise_for_status()
             flow_data = response.json()
             flow_id = flow_data.get('id')
@@ -142,7 +164,8 @@ class AuthHandler:
             registration_response = requests.post(
                 f"{self.base_url}/self-service/registration?flow={flow_id}", 
                 json=registration_payload,
-                headers=self.headers
+                headers=self.headers,
+                timeout=self.timeout
             )
             
             # Debug output
@@ -212,6 +235,10 @@ class AuthHandler:
             if not session_token:
                 print("Warning: Empty session token provided to validate_session")
                 return False, None
+
+            cached = self._session_cache.get(session_token)
+            if cached and time.monotonic() - cached[0] < self.session_cache_seconds:
+                return True, cached[1]
                 
             print(f"Validating session token: {session_token[:10]}...")
                 
@@ -222,10 +249,7 @@ class AuthHandler:
             }
             
             print(f"Making whoami request to: {self.base_url}/sessions/whoami")
-            response = requests.get(
-                f"{self.base_url}/sessions/whoami", 
-                headers=headers
-            )
+            response = self._whoami(headers)
             
             print(f"Session validation response status: {response.status_code}")
             
@@ -237,10 +261,7 @@ class AuthHandler:
                 }
                 
                 print("Trying token-based auth instead")
-                response = requests.get(
-                    f"{self.base_url}/sessions/whoami", 
-                    headers=headers
-                )
+                response = self._whoami(headers)
                 
                 print(f"Token-based validation response status: {response.status_code}")
             
@@ -256,15 +277,58 @@ class AuthHandler:
                 }
                 
                 print(f"Session valid for user: {user_data['email']}")
+                self._cache_session(session_token, user_data)
                 return True, user_data
                 
             print(f"Session validation failed: {response.text[:100]}...")
+            self._forget_session(session_token)
             return False, None
             
+        except (requests.RequestException, CircuitOpenError) as e:
+            print(f"Session validation unavailable: {str(e)}")
+            return self._stale_session(session_token)
         except Exception as e:
             print(f"Session validation error: {str(e)}")
             return False, None
 
+    def _cache_session(self, session_token: str, user_data: Dict):
+        now = time.monotonic()
+        max_age = max(self.session_cache_seconds, self.stale_session_seconds)
+        with self._session_cache_lock:
+            self._session_cache[session_token] = (now, user_data)
+            self._session_cache.move_to_end(session_token)
+            while self._session_cache:
+                oldest_token, (validated_at, _) = next(iter(self._session_cache.items()))
+                if now - validated_at < max_age and len(self._session_cache) <= self.session_cache_size:
+                    break
+                del self._session_cache[oldest_token]
+
+    def _forget_session(self, session_token: str):
+        with self._session_cache_lock:
+            self._session_cache.pop(session_token, None)
+
+    def _whoami(self, headers: Dict) -> requests.Response:
+        """Call the whoami endpoint through the Kratos circuit breaker"""
+        def request():
+            response = requests.get(
+                f"{self.base_url}/sessions/whoami", 
+                headers=headers,
+                timeout=self.timeout
+            )
+            # Server errors count against the breaker, auth failures do not
+            if response.status_code >= 500:
+                response.raise_for_status()
+            return response
+        return self.breaker.call(request)
+
+    def _stale_session(self, session_token: str) -> Tuple[bool, Optional[Dict]]:
+        """Fall back to a recent successful validation while Kratos is slow or down"""
+        cached = self._session_cache.get(session_token)
+        if cached and time.monotonic() - cached[0] < self.stale_session_seconds:
+            print("Using recently validated session while Kratos is unavailable")
+            return True, cached[1]
+        return False, None
+
     def logout(self, session_token: str) -> Tuple[bool, str]:
         """
         Handle user logout
@@ -276,6 +340,7 @@ class AuthHandler:
                 return False, "Logout failed: No session token provided"
                 
             print(f"Logging out session token: {session_token[:10]}...")
+            self._forget_session(session_token)
             
             # Try both methods of authentication
             # 1. First with the session token directly
@@ -291,7 +356,8 @@ class AuthHandler:
             response = requests.post(
                 f"{self.base_url}/self-service/logout/api", 
                 json=payload,
-                headers=headers
+                headers=headers,
+                timeout=self.timeout
             )
             
             print(f"Logout response status: {response.status_code}")
@@ -307,7 +373,8 @@ class AuthHandler:
                 response = requests.post(
                     f"{self.base_url}/self-service/logout/browser", 
                     headers=headers,
-                    allow_redirects=False
+                    allow_redirects=False,
+                    timeout=self.timeout
                 )
                 
                 print(f"Cookie-based logout response status: {response.status_code}")
@@ -0,0 +1,284 @@
+"""
+Answer a file of questions with the assistant's retrieval + LLM pipeline.
+
+    python batch_answer.py questions.jsonl answers.jsonl --workers 8
+
+Each input line is a JSON object with a "question" and optionally an "id" and
+a "user_id" whose stored chat history should be used. Answers are appended to
+the output file as they finish. Questions that already have an answer there
+are skipped, so an interrupted run can simply be started again. Batch answers
+are not stored as chat history.
+"""
+import os
+import re
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import openai
+from langchain.schema import HumanMessage
+from assistant import (
+    spaces, router, retrieve_context_by_vector, format_prompt, get_user_chat_history,
+    LLM_TIMEOUT_SECONDS, RETRIEVAL_TIMEOUT_SECONDS
+)
+from resilience import CircuitOpenError
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        """
+        Token buckets for the OpenAI request and token limits.
+        acquire() blocks until a call of the given size fits; pause() makes every
+        worker wait after the API reported a rate limit.
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.waited_seconds = 0.0
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def acquire(self, tokens: int):
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                delay = self._paused_until - now
+                if delay <= 0:
+                    if self._requests >= 1 and self._tokens >= tokens:
+                        self._requests -= 1
+                        self._tokens -= tokens
+                        return
+                    missing_requests = max(0.0, 1 - self._requests) * 60 / self.requests_per_minute
+                    missing_tokens = max(0.0, tokens - self._tokens) * 60 / self.tokens_per_minute
+                    delay = max(missing_requests, missing_tokens)
+                self.waited_seconds += delay
+            time.sleep(delay)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class BatchAnswerer:
+    def __init__(self, workers: int = 4, requests_per_minute: int = 500, tokens_per_minute: int = 200000,
+                 embedding_batch_size: int = 64, max_attempts: int = 4):
+        """Run questions through the retrieval + LLM pipeline with a bounded worker pool"""
+        self.workers = workers
+        self.embedding_batch_size = embedding_batch_size
+        self.max_attempts = max_attempts
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        # Cached embeddings are only valid for one model, so the whole batch uses one space
+        self.space = spaces.read_space()
+        self._embedding_cache = {}
+        self._stats_lock = threading.Lock()
+        self.stats = {"answered": 0, "failed": 0, "skipped": 0, "embedded": 0,
+                      "prompt_tokens": 0, "latencies": []}
+
+    def _embed(self, texts):
+        """Embed the texts that have not been seen yet, in one call per batch.
+
+        Texts are deduplicated by their normalized form, but the first original
+        text is what gets embedded, exactly as the interactive path would.
+        """
+        missing = {}
+        for text in texts:
+            key = _normalize(text)
+            if key not in self._embedding_cache:
+                missing.setdefault(key, text)
+        keys = list(missing)
+        for start in range(0, len(keys), self.embedding_batch_size):
+            chunk = keys[start:start + self.embedding_batch_size]
+            vectors = self._with_retries(self.space.embeddings.embed_documents, [missing[key] for key in chunk])
+            self._embedding_cache.update(zip(chunk, vectors))
+            self.stats["embedded"] += len(chunk)
+
+    def _with_retries(self, fn, *args, tokens: int = None, **kwargs):
+        """
+        Call fn, backing off on rate limits and open circuit breakers.
+        When tokens is given, every attempt first takes that many tokens from the limiter.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            if tokens is not None:
+                self.limiter.acquire(tokens)
+            try:
+                return fn(*args, **kwargs)
+            except (openai.RateLimitError, CircuitOpenError) as e:
+                if attempt == self.max_attempts:
+                    raise
+                backoff = 2 ** attempt
+                reason = "Rate limited" if isinstance(e, openai.RateLimitError) else "Models unavailable"
+                print(f"{reason}, pausing all workers for {backoff}s: {e}")
+                self.limiter.pause(backoff)
+                time.sleep(backoff)
+
+    def _answer(self, record):
+        started = time.monotonic()
+        question = record["question"]
+        embedding = self._embedding_cache[_normalize(question)]
+        try:
+            context = retrieve_context_by_vector(embedding, timeout=RETRIEVAL_TIMEOUT_SECONDS, space=self.space)
+        except Exception as e:
+            print(f"Retrieval failed for {record['id']}, answering without context: {e}")
+            context = ""
+
+        full_history = []
+        if record.get("user_id"):
+            full_history = get_user_chat_history(record["user_id"])[-20:]
+        full_history.append(HumanMessage(content=question))
+
+        prompt_text = format_prompt(question, context, full_history)
+        prompt_tokens = router.count_tokens(prompt_text, router.endpoints[0].name)
+        answer = self._with_retries(router.invoke, prompt_text, question, timeout=LLM_TIMEOUT_SECONDS,
+                                    tokens=prompt_tokens + router.completion_reserve)
+        with self._stats_lock:
+            self.stats["prompt_tokens"] += prompt_tokens
+        return {"id": record["id"], "question": question, "answer": answer,
+                "seconds": round(time.monotonic() - started, 3)}
+
+    def run(self, records, output_path):
+        """Answer every record not yet answered in output_path, appending results as they finish"""
+        done_ids = read_answered_ids(output_path)
+        started = time.monotonic()
+        write_lock = threading.Lock()
+        pending = set()
+
+        with open(output_path, "a", encoding="utf-8") as out, \
+                ThreadPoolExecutor(max_workers=self.workers) as executor:
+
+            def collect(futures):
+                for future in futures:
+                    record = future.record
+                    try:
+                        result = future.result()
+                        self.stats["answered"] += 1
+                        self.stats["latencies"].append(result["seconds"])
+                    except Exception as e:
+                        print(f"Failed to answer {record['id']}: {e}")
+                        result = {"id": record["id"], "question": record["question"], "error": str(e)}
+                        self.stats["failed"] += 1
+                    with write_lock:
+                        out.write(json.dumps(result) + "\n")
+                        out.flush()
+
+            chunk = []
+
+            def submit_chunk(chunk):
+                # One embedding call covers the whole chunk, duplicates included
+                self._embed([r["question"] for r in chunk])
+                for record in chunk:
+                    while len(pending) >= self.workers * 2:
+                        finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        pending.difference_update(finished)
+                        collect(finished)
+                    future = executor.submit(self._answer, record)
+                    future.record = record
+                    pending.add(future)
+
+            for record in records:
+                if record["id"] in done_ids:
+                    self.stats["skipped"] += 1
+                    continue
+                chunk.append(record)
+                if len(chunk) >= self.embedding_batch_size:
+                    submit_chunk(chunk)
+                    chunk = []
+            if chunk:
+                submit_chunk(chunk)
+
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                pending.difference_update(finished)
+                collect(finished)
+
+        self.stats["elapsed"] = time.monotonic() - started
+        self.stats["rate_limit_wait"] = self.limiter.waited_seconds
+        return self.stats
+
+
+def read_questions(path):
+    """Yield question records from a JSONL file, numbering those without an id"""
+    with open(path, "r", encoding="utf-8") as source:
+        for line_number, line in enumerate(source, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            record.setdefault("id", str(line_number))
+            record["id"] = str(record["id"])
+            yield record
+
+
+def read_answered_ids(path):
+    """IDs that already have an answer in an earlier run's output"""
+    answered = set()
+    if not os.path.exists(path):
+        return answered
+    with open(path, "r", encoding="utf-8") as source:
+        for line in source:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Partially written line from an interrupted run
+            if "answer" in result:
+                answered.add(str(result["id"]))
+    return answered
+
+
+def print_summary(stats):
+    latencies = sorted(stats["latencies"])
+    elapsed = stats["elapsed"]
+
+    def percentile(fraction):
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] if latencies else 0.0
+
+    print("Batch summary:")
+    print(f"  answered:          {stats['answered']}")
+    print(f"  failed:            {stats['failed']}")
+    print(f"  skipped (resumed): {stats['skipped']}")
+    print(f"  unique embeddings: {stats['embedded']}")
+    print(f"  prompt tokens:     {stats['prompt_tokens']}")
+    print(f"  elapsed:           {elapsed:.1f}s")
+    print(f"  throughput:        {stats['answered'] / elapsed if elapsed else 0:.2f} questions/s")
+    print(f"  latency p50/p95:   {percentile(0.5):.2f}s / {percentile(0.95):.2f}s")
+    print(f"  rate-limit waits:  {stats['rate_limit_wait']:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions")
+    parser.add_argument("questions", help="Input JSONL with a 'question' per line")
+    parser.add_argument("output", help="Output JSONL; existing answers are skipped")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("BATCH_WORKERS", "4")),
+                        help="Questions answered at the same time")
+    parser.add_argument("--requests-per-minute", type=int, default=int(os.getenv("BATCH_REQUESTS_PER_MINUTE", "500")),
+                        help="OpenAI chat request limit")
+    parser.add_argument("--tokens-per-minute", type=int, default=int(os.getenv("BATCH_TOKENS_PER_MINUTE", "200000")),
+                        help="OpenAI token limit")
+    parser.add_argument("--embedding-batch-size", type=int, default=64, help="Questions embedded per call")
+    args = parser.parse_args()
+
+    answerer = BatchAnswerer(
+        workers=args.workers,
+        requests_per_minute=args.requests_per_minute,
+        tokens_per_minute=args.tokens_per_minute,
+        embedding_batch_size=args.embedding_batch_size
+    )
+    stats = answerer.run(read_questions(args.questions), args.output)
+    print_summary(stats)
+
+
+if __name__ == "__main__":
+    main()
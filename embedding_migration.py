@@ -0,0 +1,201 @@
+"""
+Move knowledge and chat vectors to a new embedding model / index without downtime.
+
+    python embedding_migration.py start --index visionnaire-3s-512 --model text-embedding-3-small --dimensions 512
+    python embedding_migration.py backfill --workers 8
+    python embedding_migration.py switch
+    python embedding_migration.py finish
+
+start creates the target index and turns on dual writes: the running app
+keeps reading from the current index but stores new chats in both. backfill
+re-embeds every existing vector into the target index page by page and can be
+stopped and resumed. switch moves reads to the target (writes still go to both,
+so rollback stays possible) and finish stops writing to the old index. The
+app follows each step within EMBEDDING_MIGRATION_CHECK_SECONDS, no restart needed.
+After finish, update the environment and restart the app first; only then
+remove the state file.
+"""
+import os
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from pinecone import Pinecone
+from dotenv import load_dotenv, find_dotenv
+from embedding_space import (
+    EmbeddingSpace, space_config, default_space_config, read_migration_state, write_migration_state,
+    MIGRATION_STATE_PATH, DUAL_WRITE, SWITCHED, FINISHED
+)
+
+_ = load_dotenv(find_dotenv())
+
+
+def require_state(*phases):
+    state = read_migration_state()
+    if not state:
+        raise SystemExit("No embedding migration in progress. Run 'start' first.")
+    if phases and state["phase"] not in phases:
+        raise SystemExit(f"Migration is in phase '{state['phase']}', expected one of: {', '.join(phases)}")
+    return state
+
+
+def start(args):
+    if read_migration_state():
+        raise SystemExit(f"A migration is already in progress, see {MIGRATION_STATE_PATH}")
+    source = default_space_config()
+    try:
+        target = space_config(args.index, args.model, args.dimensions)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    if target["index"] == source["index"]:
+        raise SystemExit("The target index must differ from the current one")
+
+    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    EmbeddingSpace(pc, target)  # creates the target index
+    write_migration_state({
+        "source": source,
+        "target": target,
+        "phase": DUAL_WRITE,
+        "backfill": {"pagination_token": None, "done": False, "copied": 0, "skipped": 0},
+    })
+    print(f"Dual writes enabled: {source['index']} ({source['model']}, {source['dimensions']}d) -> "
+          f"{target['index']} ({target['model']}, {target['dimensions']}d)")
+
+
+def text_to_embed(metadata):
+    """Knowledge documents keep their text under 'text', chat turns under 'human_message'"""
+    metadata = metadata or {}
+    return metadata.get("text") or metadata.get("human_message")
+
+
+def copy_batch(source_index, target, ids):
+    """Fetch vectors from the source and upsert them into the target with new embeddings"""
+    response = source_index.fetch(ids=ids)
+    records = []
+    for vector_id in ids:
+        vector = response.vectors.get(vector_id)
+        if vector is not None and text_to_embed(vector.metadata):
+            records.append({"id": vector_id, "metadata": vector.metadata})
+    if records:
+        values = target.embeddings.embed_documents([text_to_embed(r["metadata"]) for r in records])
+        for record, vector_values in zip(records, values):
+            record["values"] = vector_values
+        target.index.upsert(vectors=records)
+    return len(records), len(ids) - len(records)
+
+
+def backfill(args):
+    state = require_state(DUAL_WRITE, SWITCHED)
+    progress = state["backfill"]
+    if progress["done"]:
+        print("Backfill already finished")
+        return
+
+    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    source_index = pc.Index(state["source"]["index"])
+    target = EmbeddingSpace(pc, state["target"])
+    started = time.monotonic()
+    copied_this_run = 0
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        while True:
+            page = source_index.list_paginated(limit=args.page_size,
+                                               pagination_token=progress["pagination_token"])
+            ids = [v.id for v in page.vectors]
+
+            # Split the page across the workers and wait for all of it before checkpointing
+            batches = [ids[i:i + args.batch_size] for i in range(0, len(ids), args.batch_size)]
+            for copied, skipped in executor.map(lambda batch: copy_batch(source_index, target, batch), batches):
+                progress["copied"] += copied
+                progress["skipped"] += skipped
+                copied_this_run += copied
+
+            next_token = page.pagination.next if page.pagination else None
+            progress["pagination_token"] = next_token
+            progress["done"] = next_token is None
+            # Only touch the progress, the phase may have been changed meanwhile
+            current = require_state(DUAL_WRITE, SWITCHED)
+            current["backfill"] = progress
+            write_migration_state(current)
+
+            elapsed = time.monotonic() - started
+            print(f"Copied {progress['copied']} vectors ({progress['skipped']} without text skipped), "
+                  f"{copied_this_run / elapsed if elapsed else 0:.1f}/s")
+            if progress["done"]:
+                break
+
+    print("Backfill finished. Run 'switch' to move reads to the new index.")
+
+
+def switch(args):
+    state = require_state(DUAL_WRITE)
+    if not state["backfill"]["done"] and not args.force:
+        raise SystemExit("Backfill has not finished; use --force to switch anyway")
+    state["phase"] = SWITCHED
+    write_migration_state(state)
+    print(f"Reads switched to {state['target']['index']}; writes still go to both indexes")
+
+
+def finish(args):
+    state = require_state(SWITCHED)
+    state["phase"] = FINISHED
+    write_migration_state(state)
+    target = state["target"]
+    print(f"Writes to {state['source']['index']} stopped.")
+    print(f"1. Set PINECONE_INDEX_NAME={target['index']}, EMBEDDING_MODEL={target['model']} and "
+          f"EMBEDDING_DIMENSIONS={target['dimensions']}.")
+    print("2. Restart every app process so it runs with these settings.")
+    print(f"3. Only then remove {MIGRATION_STATE_PATH}. Processes still configured with the old "
+          f"index keep using {target['index']} until they are restarted.")
+
+
+def rollback(args):
+    state = require_state(DUAL_WRITE, SWITCHED)
+    os.remove(MIGRATION_STATE_PATH)
+    print(f"Migration cancelled; reads and writes use {state['source']['index']} again. "
+          f"The index {state['target']['index']} was left in place.")
+
+
+def status(args):
+    state = read_migration_state()
+    if not state:
+        print("No embedding migration in progress")
+        return
+    source, target, progress = state["source"], state["target"], state["backfill"]
+    print(f"Phase:    {state['phase']}")
+    print(f"Source:   {source['index']} ({source['model']}, {source['dimensions']}d)")
+    print(f"Target:   {target['index']} ({target['model']}, {target['dimensions']}d)")
+    print(f"Backfill: {'done' if progress['done'] else 'in progress'}, "
+          f"{progress['copied']} copied, {progress['skipped']} skipped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embed vectors into a new index without downtime")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    start_parser = subparsers.add_parser("start", help="Create the target index and enable dual writes")
+    start_parser.add_argument("--index", required=True, help="Target index name")
+    start_parser.add_argument("--model", default="text-embedding-3-small", help="Target embedding model")
+    start_parser.add_argument("--dimensions", type=int, default=None,
+                              help="Target embedding size; text-embedding-3-* models accept reduced sizes")
+    start_parser.set_defaults(func=start)
+
+    backfill_parser = subparsers.add_parser("backfill", help="Re-embed existing vectors into the target index")
+    backfill_parser.add_argument("--page-size", type=int, default=100, help="IDs listed per page")
+    backfill_parser.add_argument("--batch-size", type=int, default=25, help="Vectors re-embedded per call")
+    backfill_parser.add_argument("--workers", type=int, default=4, help="Batches processed in parallel")
+    backfill_parser.set_defaults(func=backfill)
+
+    switch_parser = subparsers.add_parser("switch", help="Move reads to the target index")
+    switch_parser.add_argument("--force", action="store_true", help="Switch before the backfill has finished")
+    switch_parser.set_defaults(func=switch)
+
+    subparsers.add_parser("finish", help="Stop writing to the old index").set_defaults(func=finish)
+    subparsers.add_parser("rollback", help="Cancel the migration").set_defaults(func=rollback)
+    subparsers.add_parser("status", help="Show migration progress").set_defaults(func=status)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Embedding model + Pinecone index pairs, and which of them the app reads from and writes to.
+
+The embedding model and its output dimension come from EMBEDDING_MODEL and
+EMBEDDING_DIMENSIONS (text-embedding-3-* models accept reduced dimensions).
+While embedding_migration.py moves vectors to a new index, its state file
+(EMBEDDING_MIGRATION_STATE) decides where reads go and which indexes receive
+writes; changes to that file are picked up without a restart. After the
+migration has finished, restart with the new settings before removing the file.
+"""
+import os
+import json
+import time
+import threading
+from pinecone import ServerlessSpec
+from langchain_pinecone import PineconeVectorStore
+from langchain_openai import OpenAIEmbeddings
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Full output size per model; text-embedding-ada-002 cannot be shortened
+DEFAULT_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+FIXED_DIMENSION_MODELS = {"text-embedding-ada-002"}
+
+MIGRATION_STATE_PATH = os.getenv("EMBEDDING_MIGRATION_STATE", "data/embedding_migration.json")
+MIGRATION_CHECK_SECONDS = float(os.getenv("EMBEDDING_MIGRATION_CHECK_SECONDS", "5"))
+
+# Migration phases: which space is read, which spaces are written
+DUAL_WRITE = "dual_write"
+SWITCHED = "switched"
+FINISHED = "finished"
+
+
+def space_config(index_name: str, model: str, dimensions: int = None) -> dict:
+    if model in FIXED_DIMENSION_MODELS and dimensions and dimensions != DEFAULT_DIMENSIONS[model]:
+        raise ValueError(f"{model} always produces {DEFAULT_DIMENSIONS[model]}-dimensional embeddings, "
+                         f"it cannot be configured for {dimensions}")
+    return {
+        "index": index_name,
+        "model": model,
+        "dimensions": dimensions or DEFAULT_DIMENSIONS.get(model, 1536),
+    }
+
+
+def default_space_config() -> dict:
+    """The space configured through the environment"""
+    return space_config(
+        os.getenv("PINECONE_INDEX_NAME"),
+        os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002"),
+        int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None
+    )
+
+
+def connect_index(pc, index_name: str, dimension: int = None, create: bool = True):
+    """Connect to the index, creating it with the given dimension if it does not exist and create is set"""
+    try:
+        # Try to get the index first
+        index = pc.Index(index_name)
+        print(f"Connected to existing Pinecone index: {index_name}")
+    except Exception:
+        if not create or not dimension:
+            raise
+        # If index doesn't exist, create it
+        print(f"Creating new Pinecone index: {index_name}")
+        pc.create_index(
+            name=index_name,
+            spec=ServerlessSpec(
+                cloud="aws",
+                region="us-east-1"
+            ),
+            dimension=dimension,
+            metric='cosine'
+        )
+        index = pc.Index(index_name)
+    return index
+
+
+def make_embeddings(config: dict, timeout: float = None) -> OpenAIEmbeddings:
+    """Embedding client producing vectors of the configured model and size"""
+    kwargs = {}
+    if config["model"] not in FIXED_DIMENSION_MODELS:
+        kwargs["dimensions"] = config["dimensions"]
+    return OpenAIEmbeddings(
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        model=config["model"],
+        timeout=timeout,
+        max_retries=1,
+        **kwargs
+    )
+
+
+class EmbeddingSpace:
+    def __init__(self, pc, config: dict, timeout: float = None, create: bool = True):
+        """An embedding model and the index holding vectors produced by it"""
+        self.config = config
+        self.name = config["index"]
+        self.dimension = config["dimensions"]
+        self.embeddings = make_embeddings(config, timeout)
+        self.index = connect_index(pc, self.name, self.dimension, create)
+        self.vector_store = PineconeVectorStore(self.index, self.embeddings, "text")
+
+
+def read_migration_state(path: str = MIGRATION_STATE_PATH):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_migration_state(state, path: str = MIGRATION_STATE_PATH):
+    """Replace the state file in one step so readers never see a partial file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class SpaceResolver:
+    def __init__(self, pc, default: dict, timeout: float = None, state_path: str = MIGRATION_STATE_PATH):
+        """
+        Resolve the read and write spaces, following the migration state file.
+        Only the default index may be created by the app; migration targets are
+        created by embedding_migration.py. Once a migration has finished, its
+        target stays in use even if the state file disappears, until the process
+        is restarted with the target configured as the default.
+        """
+        self.pc = pc
+        self.default = default
+        self.timeout = timeout
+        self.state_path = state_path
+        self._spaces = {}
+        self._state = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh(force=True)
+
+    def _space(self, config):
+        """Connect to the space outside the lock, so other requests are not held up by Pinecone"""
+        with self._lock:
+            space = self._spaces.get(config["index"])
+        if space is None:
+            space = EmbeddingSpace(self.pc, config, self.timeout, create=config == self.default)
+            with self._lock:
+                space = self._spaces.setdefault(config["index"], space)
+        return space
+
+    def _refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked_at < MIGRATION_CHECK_SECONDS:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.path.getmtime(self.state_path) if self.state_path else None
+        except OSError:
+            mtime = None
+        if mtime == self._mtime and not force:
+            return
+        self._mtime = mtime
+        try:
+            state = read_migration_state(self.state_path)
+        except Exception as e:
+            print(f"Error reading embedding migration state, keeping the previous one: {e}")
+            return
+        previous = self._state
+        if (state is None and previous and previous["phase"] == FINISHED
+                and previous["target"] != self.default):
+            # Writes to the source index have stopped; going back to it would hide newer chats
+            print(f"Embedding migration state removed, but the configured index is still "
+                  f"{self.default['index']}; keeping {previous['target']['index']} until restart")
+            return
+        if state != previous:
+            phase = state["phase"] if state else "none"
+            print(f"Embedding migration phase: {phase}")
+        self._state = state
+
+    def _configs(self):
+        """(read config, write configs) for the current phase"""
+        state = self._state
+        if not state:
+            return self.default, [self.default]
+        if state["phase"] == DUAL_WRITE:
+            return state["source"], [state["source"], state["target"]]
+        if state["phase"] == SWITCHED:
+            return state["target"], [state["target"], state["source"]]
+        return state["target"], [state["target"]]
+
+    def read_space(self) -> EmbeddingSpace:
+        with self._lock:
+            self._refresh()
+            read_config, _ = self._configs()
+        return self._space(read_config)
+
+    def write_spaces(self) -> list:
+        """Every space a new vector must be written to; the read space comes first.
+
+        A secondary space that cannot be connected to is left out, so it never
+        blocks writes to the space being read from.
+        """
+        with self._lock:
+            self._refresh()
+            _, write_configs = self._configs()
+        spaces = [self._space(write_configs[0])]
+        for config in write_configs[1:]:
+            try:
+                spaces.append(self._space(config))
+            except Exception as e:
+                print(f"Error connecting to index {config['index']}, skipping its writes: {e}")
+        return spaces
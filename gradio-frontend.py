@@ -1,9 +1,15 @@
 import gradio as gr
 import random
-from assistant import predict
+from assistant import predict, clear_user_history_cache, PREDICT_DEADLINE_SECONDS, RETRIEVAL_TIMEOUT_SECONDS
 from auth_handler import AuthHandler
+from resilience import Deadline
+from warmup import warmup_manager_from_env
+from speculative import prefetcher_from_env
+import tracing
 
 auth = AuthHandler()
+warmup = warmup_manager_from_env()
+prefetcher = prefetcher_from_env()  # None unless SPECULATIVE_PREFETCH=1
 
 # Gradio Interface
 with gr.Blocks(theme=gr.themes.Soft(primary_hue="blue")) as demo:
@@ -16,6 +22,7 @@ with gr.Blocks(theme=gr.themes.Soft(primary_hue="blue")) as demo:
     
     history = gr.State(value=[])
     session_token = gr.State(value="")
+    user_id = gr.State(value="")
     
     # Login/Register Selection
     with gr.Group():
@@ -104,6 +111,8 @@ with gr.Blocks(theme=gr.themes.Soft(primary_hue="blue")) as demo:
         if success and token:
             is_valid, user_data = auth.validate_session(token)
             if is_valid and user_data:
+                # The validation above seeds the session cache; warm up the rest in the background
+                warmup.start(token, user_data['id'])
                 user_info_text = f"👤 Logged in as: {user_data.get('name', 'User')} ({user_data.get('email', 'No email')})"
                 return {
                     login_message: gr.Markdown(f"✅ {message}"),
@@ -112,6 +121,7 @@ with gr.Blocks(theme=gr.themes.Soft(primary_hue="blue")) as demo:
                     chatbot: [],
                     history: [],
                     session_token: token,
+                    user_id: user_data['id'],
                     user_info: user_info_text,
                     message_input: gr.Textbox(value="")  # Clear message input on login
                 }
@@ -119,13 +129,14 @@ with gr.Blocks(theme=gr.themes.Soft(primary_hue="blue")) as demo:
             login_message: gr.Markdown(f"❌ {message}"),
             main_interface: gr.Group(visible=False),
             session_token: "",
+            user_id: "",
             user_info: ""
         }
     
     login_button.click(
         handle_login,
         inputs=[email_input, password_input],
-        outputs=[login_message, main_interface, login_section, chatbot, history, session_token, user_info, message_input]
+        outputs=[login_message, main_interface, login_section, chatbot, history, session_token, user_id, user_info, message_input]
     )
 
     # Registration Logic
@@ -142,7 +153,7 @@ with gr.Blocks(theme=gr.themes.Soft(primary_hue="blue")) as demo:
     )
 
     # Logout Logic
-    def handle_logout(token):
+    def handle_logout(token, current_user_id):
         # Print token value for debugging
         print(f"Logging out with token: {token}")
         
@@ -154,6 +165,13 @@ with gr.Blocks(theme=gr.themes.Soft(primary_hue="blue")) as demo:
                 login_message: gr.Markdown("⚠️ No active session to log out from.")
             }
             
+        warmup.cancel(token)
+        # The warm-up may have finished long ago, so drop the cached history directly
+        if current_user_id:
+            clear_user_history_cache(current_user_id)
+        if prefetcher:
+            prefetcher.discard(token)
+
         # Directly handle logout without relying on the auth handler
         # Since there seems to be an issue with the auth handler's logout function
         try:
@@ -168,6 +186,7 @@ with gr.Blocks(theme=gr.themes.Soft(primary_hue="blue")) as demo:
             login_section: gr.Group(visible=True),
             register_section: gr.Group(visible=False),
             session_token: "",
+            user_id: "",
             login_message: gr.Markdown("✅ Logged out successfully!"),
             email_input: gr.Textbox(value=""),
             password_input: gr.Textbox(value=""),
@@ -178,8 +197,8 @@ with gr.Blocks(theme=gr.themes.Soft(primary_hue="blue")) as demo:
 
     logout_button.click(
         handle_logout,
-        inputs=[session_token],
-        outputs=[main_interface, login_section, register_section, session_token, login_message, 
+        inputs=[session_token, user_id],
+        outputs=[main_interface, login_section, register_section, session_token, user_id, login_message, 
                 email_input, password_input, message_input, chatbot, history]
     )
         
@@ -188,14 +207,26 @@ with gr.Blocks(theme=gr.themes.Soft(primary_hue="blue")) as demo:
         if not message.strip():
             return history, gr.Group(visible=True), gr.Group(visible=False), gr.Textbox(value="")
             
-        is_valid, user_data = auth.validate_session(session_token)
-        if not is_valid:
-            history.append(("", "⚠️ Your session has expired. Please login again."))
-            return history, gr.Group(visible=False), gr.Group(visible=True), gr.Textbox(value="")
-        
-        # Use user's ID from Ory for chat history
-        new_history, _ = predict(message, history, user_data['id'])
-        return new_history, gr.Group(visible=True), gr.Group(visible=False), gr.Textbox(value="")
+        with tracing.trace_request(message):
+            # Session validation and answering share one time budget
+            deadline = Deadline(PREDICT_DEADLINE_SECONDS)
+            with tracing.stage("validate_session"):
+                is_valid, user_data = auth.validate_session(session_token)
+            if not is_valid:
+                history.append(("", "⚠️ Your session has expired. Please login again."))
+                return history, gr.Group(visible=False), gr.Group(visible=True), gr.Textbox(value="")
+            
+            # Reuse retrieval started while the message was being typed; waiting
+            # for it spends the retrieval budget, so predict never retrieves twice
+            context = None
+            if prefetcher:
+                with tracing.stage("prefetch_wait"):
+                    context = prefetcher.take(session_token, message, deadline.budget(RETRIEVAL_TIMEOUT_SECONDS))
+            
+            # Use user's ID from Ory for chat history
+            with tracing.stage("predict"):
+                new_history, _ = predict(message, history, user_data['id'], deadline=deadline, context=context)
+            return new_history, gr.Group(visible=True), gr.Group(visible=False), gr.Textbox(value="")
 
     # Bind the handle_chat function to both send button and message_input (for Enter key)
     send_button.click(
@@ -211,6 +242,24 @@ with gr.Blocks(theme=gr.themes.Soft(primary_hue="blue")) as demo:
         outputs=[chatbot, main_interface, login_section, message_input]
     )
 
+    # Speculative retrieval while typing (optional)
+    def handle_draft(message, session_token, current_user_id):
+        """Start prefetching retrieval for the current draft.
+
+        The session is validated when the message is sent, not on every keystroke.
+        """
+        if session_token and current_user_id:
+            prefetcher.update_draft(session_token, current_user_id, message)
+
+    if prefetcher:
+        message_input.change(
+            handle_draft,
+            inputs=[message_input, session_token, user_id],
+            outputs=None,
+            trigger_mode="always_last",
+            show_progress="hidden"
+        )
+
 # Change server_name from 127.0.0.1 to 0.0.0.0 to make it publicly accessible
 # This will make it listen on all network interfaces
 demo.launch(server_name="0.0.0.0", server_port=7861, share=True)
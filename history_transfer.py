@@ -0,0 +1,200 @@
+"""
+Export chat history from Pinecone to gzip-compressed NDJSON and load it back.
+
+    python history_transfer.py export chats.ndjson.gz
+    python history_transfer.py import chats.ndjson.gz --index new-index --workers 8
+
+Export pages through the index ID listing and fetches each page in one call,
+so memory stays constant however much history there is. Import upserts in
+parallel batches and records its progress in <file>.checkpoint, so an
+interrupted import continues where it stopped when run again.
+"""
+import os
+import json
+import gzip
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pinecone import Pinecone
+from dotenv import load_dotenv, find_dotenv
+from embedding_space import connect_index, make_embeddings, default_space_config
+
+_ = load_dotenv(find_dotenv())
+
+
+def get_index(index_name, dimension=None):
+    """Connect to the index, creating it first when a dimension is given and it does not exist"""
+    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    return connect_index(pc, index_name, dimension, create=bool(dimension))
+
+
+def is_chat_record(metadata):
+    """Chat turns are the records written by store_chat_in_pinecone"""
+    return bool(metadata) and "user_id" in metadata and "human_message" in metadata
+
+
+def export_history(args):
+    index = get_index(args.index)
+    exported = 0
+    scanned = 0
+    started = time.monotonic()
+
+    with gzip.open(args.file, "wt", encoding="utf-8") as out:
+        # index.list yields one page of IDs at a time
+        for page in index.list(prefix=args.prefix, limit=args.page_size, namespace=args.namespace):
+            if not page:
+                continue
+            response = index.fetch(ids=list(page), namespace=args.namespace)
+            for vector_id in page:
+                vector = response.vectors.get(vector_id)
+                scanned += 1
+                if vector is None or not is_chat_record(vector.metadata):
+                    continue
+                record = {"id": vector_id, "metadata": vector.metadata}
+                if not args.without_values:
+                    record["values"] = list(vector.values)
+                out.write(json.dumps(record) + "\n")
+                exported += 1
+            print(f"Scanned {scanned} vectors, exported {exported} chat turns")
+
+    elapsed = time.monotonic() - started
+    print(f"Export finished: {exported} chat turns written to {args.file} in {elapsed:.1f}s")
+
+
+def read_checkpoint(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f).get("lines_done", 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(path, lines_done):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"lines_done": lines_done}, f)
+    os.replace(tmp_path, path)
+
+
+def upsert_batch(index, embeddings, records, namespace, reembed, attempts=3):
+    """Upsert one batch, embedding the human messages first when values are missing or re-embedding is requested"""
+    if reembed or any("values" not in record for record in records):
+        vectors = embeddings.embed_documents([r["metadata"]["human_message"] for r in records])
+        for record, values in zip(records, vectors):
+            record["values"] = values
+
+    for attempt in range(1, attempts + 1):
+        try:
+            index.upsert(vectors=records, namespace=namespace)
+            return len(records)
+        except Exception as e:
+            if attempt == attempts:
+                raise
+            print(f"Upsert failed (attempt {attempt}/{attempts}): {e}")
+            time.sleep(2 ** attempt)
+
+
+def import_history(args):
+    checkpoint_path = f"{args.file}.checkpoint"
+    lines_done = 0 if args.restart else read_checkpoint(checkpoint_path)
+    if lines_done:
+        print(f"Resuming import after {lines_done} lines")
+
+    index = get_index(args.index, args.dimension)
+    # Re-embedding uses the configured EMBEDDING_MODEL / EMBEDDING_DIMENSIONS
+    embeddings = make_embeddings(default_space_config())
+
+    # Batches finish out of order; the checkpoint only moves past a batch
+    # once every batch before it has been written too
+    batch_ends = {}
+    finished = set()
+    next_to_commit = 0
+    pending = set()
+    imported = 0
+    started = time.monotonic()
+
+    def collect(done):
+        nonlocal next_to_commit, lines_done, imported
+        for future in done:
+            imported += future.result()
+            finished.add(future.seq)
+        while next_to_commit in finished:
+            finished.discard(next_to_commit)
+            lines_done = batch_ends.pop(next_to_commit)
+            next_to_commit += 1
+        write_checkpoint(checkpoint_path, lines_done)
+
+    with gzip.open(args.file, "rt", encoding="utf-8") as source, \
+            ThreadPoolExecutor(max_workers=args.workers) as executor:
+        seq = 0
+        line_number = 0
+        batch = []
+
+        def submit(batch, end_line):
+            nonlocal seq
+            future = executor.submit(upsert_batch, index, embeddings, batch,
+                                     args.namespace, args.reembed)
+            future.seq = seq
+            batch_ends[seq] = end_line
+            pending.add(future)
+            seq += 1
+
+        for line in source:
+            line_number += 1
+            if line_number <= lines_done or not line.strip():
+                continue
+            batch.append(json.loads(line))
+            if len(batch) >= args.batch_size:
+                submit(batch, line_number)
+                batch = []
+                # Keep a bounded number of batches in flight
+                while len(pending) >= args.workers * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    pending.difference_update(done)
+                    collect(done)
+                    print(f"Imported {imported} chat turns")
+
+        if batch:
+            submit(batch, line_number)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            pending.difference_update(done)
+            collect(done)
+
+    elapsed = time.monotonic() - started
+    print(f"Import finished: {imported} chat turns upserted into {args.index} in {elapsed:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or bulk-load chat history")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Stream chat history to gzip NDJSON")
+    export_parser.add_argument("file", help="Output file, e.g. chats.ndjson.gz")
+    export_parser.add_argument("--index", default=os.getenv("PINECONE_INDEX_NAME"), help="Source index")
+    export_parser.add_argument("--namespace", default="", help="Source namespace")
+    export_parser.add_argument("--prefix", default=None, help="Only export IDs with this prefix, e.g. a user ID")
+    export_parser.add_argument("--page-size", type=int, default=100, help="IDs listed and fetched per page")
+    export_parser.add_argument("--without-values", action="store_true",
+                               help="Leave out the vectors so the import re-embeds them")
+    export_parser.set_defaults(func=export_history)
+
+    import_parser = subparsers.add_parser("import", help="Bulk-load a gzip NDJSON export")
+    import_parser.add_argument("file", help="Export file to load")
+    import_parser.add_argument("--index", default=os.getenv("PINECONE_INDEX_NAME"), help="Target index")
+    import_parser.add_argument("--namespace", default="", help="Target namespace")
+    import_parser.add_argument("--dimension", type=int, default=None,
+                               help="Create the target index with this dimension if it does not exist")
+    import_parser.add_argument("--batch-size", type=int, default=100, help="Vectors per upsert")
+    import_parser.add_argument("--workers", type=int, default=4, help="Parallel upserts")
+    import_parser.add_argument("--reembed", action="store_true",
+                               help="Re-embed the human messages instead of using the exported vectors")
+    import_parser.add_argument("--restart", action="store_true", help="Ignore any existing checkpoint")
+    import_parser.set_defaults(func=import_history)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import deque, Counter
+import openai
+import tiktoken
+from langchain_openai import ChatOpenAI
+from dotenv import load_dotenv
+from resilience import Deadline, DeadlineExceeded, CircuitOpenError, CircuitBreaker, breaker_from_env
+import tracing
+
+load_dotenv()
+
+# Context window sizes (tokens) for the models we expect to route between
+CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 16385
+
+# Words that usually mean the question needs more reasoning than a quick lookup
+COMPLEX_KEYWORDS = re.compile(
+    r"\b(explain|compare|why|analy[sz]e|design|prove|derive|step by step|trade-?offs?|evaluate|debug)\b",
+    re.IGNORECASE
+)
+
+
+def _model_list(value: str) -> list:
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+class ModelStats:
+    def __init__(self, window: int, max_age: float = 300.0):
+        """
+        Rolling latency and error samples for one model.
+        Samples older than max_age seconds are dropped, so a model that was
+        degraded is judged afresh (and tried again) once it has recovered.
+        """
+        self.max_age = max_age
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, success: bool):
+        with self._lock:
+            self._samples.append((time.monotonic(), latency, success))
+
+    def _current(self) -> list:
+        with self._lock:
+            cutoff = time.monotonic() - self.max_age
+            while self._samples and self._samples[0][0] < cutoff:
+                self._samples.popleft()
+            return list(self._samples)
+
+    @property
+    def latencies(self) -> list:
+        return [latency for _, latency, _ in self._current()]
+
+    @property
+    def outcomes(self) -> list:
+        return [success for _, _, success in self._current()]
+
+    def p95(self) -> float:
+        """95th percentile latency in seconds, or 0 when nothing was recorded yet"""
+        latencies = self.latencies
+        if not latencies:
+            return 0.0
+        ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def error_rate(self) -> float:
+        outcomes = self.outcomes
+        if not outcomes:
+            return 0.0
+        return outcomes.count(False) / len(outcomes)
+
+
+class ModelEndpoint:
+    def __init__(self, name: str, tier: str, llm: ChatOpenAI, breaker: CircuitBreaker, window: int,
+                 sample_max_age: float = 300.0):
+        """A chat model the router can send prompts to"""
+        self.name = name
+        self.tier = tier
+        self.llm = llm
+        self.breaker = breaker
+        self.context_window = CONTEXT_WINDOWS.get(name, DEFAULT_CONTEXT_WINDOW)
+        self.stats = ModelStats(window, sample_max_age)
+
+
+class ModelRouter:
+    def __init__(self, fast_models: list, strong_models: list, temperature: float = 0,
+                 timeout: float = 20.0, complex_tokens: int = 2000, max_p95_seconds: float = 10.0,
+                 max_error_rate: float = 0.5, min_samples: int = 5, window: int = 50,
+                 completion_reserve: int = 1024, sample_max_age: float = 300.0):
+        """
+        Pick a chat model per prompt.
+        Simple turns go to the fast model with the lowest live p95 latency, complex
+        turns (large prompts or reasoning-heavy questions) prefer the strong models in
+        configured order. Models whose p95 latency, error rate or circuit breaker show
+        they are degraded are only used when nothing healthy is left, and a failed
+        call fails over to the next candidate while the time budget allows.
+        Latency and error samples expire after sample_max_age seconds, so a
+        degraded model is routed to again once its bad samples have aged out.
+        """
+        if not fast_models and not strong_models:
+            raise ValueError("ModelRouter needs at least one model")
+        self.complex_tokens = complex_tokens
+        self.max_p95_seconds = max_p95_seconds
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.completion_reserve = completion_reserve
+        self.endpoints = []
+        for tier, names in (("fast", fast_models), ("strong", strong_models)):
+            for name in names:
+                llm = ChatOpenAI(model=name, temperature=temperature, timeout=timeout, max_retries=1)
+                breaker = breaker_from_env(f"openai-{name}", "LLM")
+                self.endpoints.append(ModelEndpoint(name, tier, llm, breaker, window, sample_max_age))
+        self._lock = threading.Lock()
+        self._decisions = Counter()
+        self._failovers = Counter()
+        self._encodings = {}
+
+    def count_tokens(self, text: str, model: str) -> int:
+        """Count prompt tokens with the model's tiktoken encoding"""
+        if model not in self._encodings:
+            try:
+                self._encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self._encodings[model] = tiktoken.get_encoding("cl100k_base")
+        return len(self._encodings[model].encode(text))
+
+    def is_complex(self, question: str, prompt_tokens: int) -> bool:
+        """Cheap heuristic for turns that deserve a stronger model"""
+        if prompt_tokens >= self.complex_tokens:
+            return True
+        score = 0
+        if len(question.split()) > 40:
+            score += 1
+        if COMPLEX_KEYWORDS.search(question):
+            score += 1
+        if question.count("?") > 1:
+            score += 1
+        if "```" in question:
+            score += 1
+        return score >= 2
+
+    def is_healthy(self, endpoint: ModelEndpoint) -> bool:
+        # An open breaker past its reset timeout is eligible again, so the model gets its trial call
+        if endpoint.breaker.is_open():
+            return False
+        outcomes = endpoint.stats.outcomes
+        if len(outcomes) < self.min_samples:
+            return True
+        return (endpoint.stats.p95() <= self.max_p95_seconds
+                and outcomes.count(False) / len(outcomes) <= self.max_error_rate)
+
+    def route(self, prompt_text: str, question: str) -> tuple:
+        """
+        Order the models to try for this prompt.
+        Returns: (endpoints, reason, prompt_tokens)
+        """
+        prompt_tokens = self.count_tokens(prompt_text, self.endpoints[0].name)
+        complex_turn = self.is_complex(question, prompt_tokens)
+
+        fitting = [e for e in self.endpoints
+                   if prompt_tokens + self.completion_reserve <= e.context_window]
+        if not fitting:
+            # Nothing fits comfortably; let the largest window try
+            fitting = sorted(self.endpoints, key=lambda e: e.context_window, reverse=True)
+
+        health = {e.name: self.is_healthy(e) for e in fitting}
+        healthy = [e for e in fitting if health[e.name]]
+        degraded = [e for e in fitting if not health[e.name]]
+
+        fast = sorted((e for e in healthy if e.tier == "fast"), key=lambda e: e.stats.p95())
+        strong = [e for e in healthy if e.tier == "strong"]
+        if complex_turn:
+            ordered = strong + fast
+            reason = "complex"
+        else:
+            ordered = fast + strong
+            reason = "simple"
+        if not ordered:
+            reason = "degraded"
+        ordered += sorted(degraded, key=lambda e: e.stats.error_rate())
+        return ordered, reason, prompt_tokens
+
+    def invoke(self, prompt_text: str, question: str, timeout: float) -> str:
+        """Answer the prompt with the routed model, failing over within the timeout"""
+        deadline = Deadline(timeout)
+        candidates, reason, prompt_tokens = self.route(prompt_text, question)
+        print(f"Routing {prompt_tokens}-token {reason} prompt to {candidates[0].name}")
+        with self._lock:
+            self._decisions[(candidates[0].name, reason)] += 1
+        tracing.record(prompt_tokens=prompt_tokens, route=reason)
+
+        last_error = None
+        for position, endpoint in enumerate(candidates):
+            if deadline.expired():
+                break
+            if position > 0:
+                print(f"Failing over to {endpoint.name} after: {last_error}")
+                with self._lock:
+                    self._failovers[endpoint.name] += 1
+            started = time.monotonic()
+            try:
+                # A rate limit is backpressure, not a sign the model is unhealthy
+                response = endpoint.breaker.call(endpoint.llm.invoke, prompt_text, timeout=deadline.remaining(),
+                                                 ignore=(openai.RateLimitError,))
+            except (CircuitOpenError, openai.RateLimitError) as e:
+                last_error = e
+                continue
+            except Exception as e:
+                endpoint.stats.record(time.monotonic() - started, False)
+                last_error = e
+                continue
+            endpoint.stats.record(time.monotonic() - started, True)
+            if tracing.current() is not None:
+                tracing.record(model=endpoint.name, failovers=position,
+                               answer_tokens=self.count_tokens(response.content, endpoint.name))
+            return response.content
+
+        if last_error is None:
+            raise DeadlineExceeded("No time left to call a model")
+        raise last_error
+
+    def metrics(self) -> dict:
+        """Snapshot of routing decisions and live per-model health"""
+        with self._lock:
+            decisions = {f"{model}:{reason}": count for (model, reason), count in self._decisions.items()}
+            failovers = dict(self._failovers)
+        return {
+            "decisions": decisions,
+            "failovers": failovers,
+            "models": {
+                e.name: {
+                    "tier": e.tier,
+                    "p95_seconds": round(e.stats.p95(), 3),
+                    "error_rate": round(e.stats.error_rate(), 3),
+                    "samples": len(e.stats.outcomes),
+                    "breaker": e.breaker.state,
+                    "healthy": self.is_healthy(e),
+                }
+                for e in self.endpoints
+            },
+        }
+
+    def log_metrics_every(self, interval: float):
+        """Print the routing metrics every interval seconds from a daemon thread"""
+        def run():
+            while True:
+                time.sleep(interval)
+                print(f"Router metrics: {json.dumps(self.metrics(), sort_keys=True)}")
+
+        threading.Thread(target=run, name="router-metrics", daemon=True).start()
+
+
+def router_from_env(timeout: float) -> ModelRouter:
+    """Build the router from LLM_FAST_MODELS / LLM_STRONG_MODELS and ROUTER_* variables"""
+    router = ModelRouter(
+        fast_models=_model_list(os.getenv("LLM_FAST_MODELS", "gpt-3.5-turbo")),
+        strong_models=_model_list(os.getenv("LLM_STRONG_MODELS", "")),
+        timeout=timeout,
+        complex_tokens=int(os.getenv("ROUTER_COMPLEX_TOKENS", "2000")),
+        max_p95_seconds=float(os.getenv("ROUTER_MAX_P95_SECONDS", "10")),
+        max_error_rate=float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.5")),
+        min_samples=int(os.getenv("ROUTER_MIN_SAMPLES", "5")),
+        window=int(os.getenv("ROUTER_WINDOW", "50")),
+        sample_max_age=float(os.getenv("ROUTER_SAMPLE_MAX_AGE_SECONDS", "300")),
+    )
+    metrics_interval = float(os.getenv("ROUTER_METRICS_LOG_SECONDS", "300"))
+    if metrics_interval > 0:
+        router.log_metrics_every(metrics_interval)
+    return router
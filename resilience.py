@@ -0,0 +1,174 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class DeadlineExceeded(Exception):
+    """Raised when a call does not finish within its time budget."""
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because its circuit breaker is open."""
+
+
+class BulkheadFullError(CircuitOpenError):
+    """Raised when every slot of a dependency's bulkhead is taken by calls still running."""
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        """Track the time left for a single request"""
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def budget(self, timeout: float) -> float:
+        """Return the given per-call timeout, capped by the time left on the deadline"""
+        return min(timeout, self.remaining())
+
+
+class Bulkhead:
+    def __init__(self, name: str, max_concurrent: int = 8):
+        """
+        A bounded set of threads for one dependency.
+        A call that times out keeps its slot until it really returns, so a hung
+        dependency can only exhaust its own bulkhead, never another dependency's.
+        """
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix=f"bulkhead-{name}")
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    def call(self, fn, timeout: float, *args, **kwargs):
+        """
+        Run fn on the bulkhead and wait at most timeout seconds for it.
+        The underlying call is not interrupted; its result is simply discarded.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise BulkheadFullError(f"All {self.max_concurrent} '{self.name}' calls are still running")
+        try:
+            future = self._pool.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise DeadlineExceeded(f"{getattr(fn, '__name__', fn)} timed out after {timeout:.2f}s")
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 max_concurrent: int = 8):
+        """
+        Stop calling a dependency after repeated failures.
+        After reset_timeout seconds a single trial call is let through (half open);
+        it closes the breaker on success and re-opens it on failure. Calls with a
+        timeout run on the breaker's own bulkhead of max_concurrent threads.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.bulkhead = Bulkhead(name, max_concurrent)
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                print(f"Circuit breaker '{self.name}' half open, allowing a trial call")
+                self.state = self.HALF_OPEN
+                return True
+            if self.state == self.HALF_OPEN:
+                # Only one trial call at a time
+                return False
+            return True
+
+    def is_open(self) -> bool:
+        """True while the breaker rejects calls; an open breaker past its reset timeout is due a trial"""
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at < self.reset_timeout
+            return self.state == self.HALF_OPEN
+
+    def record_success(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                # A call that started before the breaker opened says nothing about recovery
+                return
+            if self.state == self.HALF_OPEN:
+                print(f"Circuit breaker '{self.name}' closed")
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"Circuit breaker '{self.name}' opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release_trial(self):
+        """Give back a half-open trial slot when the trial call was never made"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def call(self, fn, *args, timeout: float = None, ignore=(), **kwargs):
+        """
+        Run fn through the breaker, optionally bounded by timeout seconds.
+        Exceptions listed in ignore are raised without counting as a failure,
+        e.g. rate limits, which say nothing about the dependency's health.
+        """
+        # A request that has no time left never reaches the dependency,
+        # so it must not count against the dependency's health
+        if timeout is not None and timeout <= 0:
+            raise DeadlineExceeded(f"No time left to call {getattr(fn, '__name__', fn)}")
+        if not self.allow_request():
+            raise CircuitOpenError(f"Circuit breaker '{self.name}' is open")
+        try:
+            if timeout is None:
+                result = fn(*args, **kwargs)
+            else:
+                result = self.bulkhead.call(fn, timeout, *args, **kwargs)
+        except BulkheadFullError:
+            # Too many calls in flight is load on our side, not a failing dependency
+            self.release_trial()
+            raise
+        except ignore:
+            self.release_trial()
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+
+def breaker_from_env(name: str, prefix: str) -> CircuitBreaker:
+    """Build a breaker whose thresholds can be tuned with <PREFIX>_BREAKER_* / <PREFIX>_MAX_CONCURRENT variables"""
+    return CircuitBreaker(
+        name,
+        failure_threshold=int(os.getenv(f"{prefix}_BREAKER_FAILURES", "5")),
+        reset_timeout=float(os.getenv(f"{prefix}_BREAKER_RESET_SECONDS", "30")),
+        max_concurrent=int(os.getenv(f"{prefix}_MAX_CONCURRENT", "8"))
+    )
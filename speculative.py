@@ -0,0 +1,151 @@
+import os
+import re
+import time
+import difflib
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dotenv import load_dotenv
+from assistant import spaces, retrieve_context_by_vector, get_user_chat_history
+import tracing
+
+load_dotenv()
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class Prefetch:
+    def __init__(self, draft: str):
+        """Retrieval started for one draft of a message"""
+        self.draft = draft
+        self.normalized = _normalize(draft)
+        self.started_at = time.monotonic()
+        self.cancelled = threading.Event()
+        self.future = None
+
+
+class SpeculativePrefetcher:
+    def __init__(self, debounce_seconds: float = 0.4, min_chars: int = 12, match_ratio: float = 0.9,
+                 ttl_seconds: float = 60.0, max_workers: int = 4):
+        """
+        Start retrieval while the user is still typing.
+        Draft changes are debounced per session; once a draft has been stable for
+        debounce_seconds its query is embedded and the knowledge context and user
+        history are fetched in the background. A newer draft cancels the older
+        prefetch. When the message is sent, take() returns the prefetched context
+        if the final text is close enough to the draft it was fetched for.
+        """
+        self.debounce_seconds = debounce_seconds
+        self.min_chars = min_chars
+        self.match_ratio = match_ratio
+        self.ttl_seconds = ttl_seconds
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative")
+        self._timers = {}
+        self._prefetches = {}
+        self._lock = threading.Lock()
+
+    def update_draft(self, session_key: str, user_id: str, draft: str):
+        """Record the latest draft for the session and (re)start the debounce timer"""
+        if not session_key or not user_id:
+            return
+        with self._lock:
+            timer = self._timers.pop(session_key, None)
+            if timer:
+                timer.cancel()
+            if len(draft.strip()) < self.min_chars:
+                return
+            timer = threading.Timer(self.debounce_seconds, self._start, args=(session_key, user_id, draft))
+            timer.daemon = True
+            self._timers[session_key] = timer
+        timer.start()
+
+    def _start(self, session_key, user_id, draft):
+        prefetch = Prefetch(draft)
+        with self._lock:
+            if self._timers.get(session_key) is not threading.current_thread():
+                return
+            del self._timers[session_key]
+            previous = self._prefetches.get(session_key)
+            if previous and previous.normalized == prefetch.normalized:
+                return
+            if previous:
+                self._cancel(previous)
+            prefetch.future = self._pool.submit(self._run, prefetch, user_id)
+            self._prefetches[session_key] = prefetch
+
+    def _run(self, prefetch, user_id):
+        if prefetch.cancelled.is_set():
+            return None
+        # History lands in the assistant's history cache, predict picks it up from there
+        get_user_chat_history(user_id)
+        if prefetch.cancelled.is_set():
+            return None
+        space = spaces.read_space()
+        embedding = space.embeddings.embed_query(prefetch.draft)
+        if prefetch.cancelled.is_set():
+            return None
+        context = retrieve_context_by_vector(embedding, space=space)
+        print(f"Prefetched context for draft: '{prefetch.draft[:30]}...'")
+        return context
+
+    def _cancel(self, prefetch):
+        prefetch.cancelled.set()
+        if prefetch.future:
+            prefetch.future.cancel()
+
+    def take(self, session_key: str, message: str, timeout: float):
+        """
+        Return the context prefetched for a draft close to message.
+        A matching prefetch that is still running is waited on for up to timeout
+        seconds, which is the retrieval budget: if it fails or does not finish in
+        time, "" is returned so the message is answered without context instead
+        of retrieving again. None means there was nothing to reuse.
+        """
+        with self._lock:
+            timer = self._timers.pop(session_key, None)
+            if timer:
+                timer.cancel()
+            prefetch = self._prefetches.pop(session_key, None)
+        if prefetch is None:
+            return None
+        if time.monotonic() - prefetch.started_at > self.ttl_seconds:
+            self._cancel(prefetch)
+            return None
+        ratio = difflib.SequenceMatcher(None, prefetch.normalized, _normalize(message)).ratio()
+        if ratio < self.match_ratio:
+            print(f"Prefetched draft does not match the message (similarity {ratio:.2f})")
+            self._cancel(prefetch)
+            return None
+        try:
+            return prefetch.future.result(timeout=max(timeout, 0))
+        except FutureTimeoutError:
+            print("Speculative prefetch did not finish in time, answering without context")
+            self._cancel(prefetch)
+        except Exception as e:
+            print(f"Speculative prefetch failed, answering without context: {e}")
+        tracing.record(retrieval_fallback=True)
+        return ""
+
+    def discard(self, session_key: str):
+        """Cancel everything pending for the session, e.g. on logout"""
+        with self._lock:
+            timer = self._timers.pop(session_key, None)
+            prefetch = self._prefetches.pop(session_key, None)
+        if timer:
+            timer.cancel()
+        if prefetch:
+            self._cancel(prefetch)
+
+
+def prefetcher_from_env():
+    """Build the prefetcher when SPECULATIVE_PREFETCH is enabled, otherwise return None"""
+    if os.getenv("SPECULATIVE_PREFETCH", "0") != "1":
+        return None
+    return SpeculativePrefetcher(
+        debounce_seconds=float(os.getenv("SPECULATIVE_DEBOUNCE_SECONDS", "0.4")),
+        min_chars=int(os.getenv("SPECULATIVE_MIN_CHARS", "12")),
+        match_ratio=float(os.getenv("SPECULATIVE_MATCH_RATIO", "0.9")),
+        ttl_seconds=float(os.getenv("SPECULATIVE_TTL_SECONDS", "60")),
+        max_workers=int(os.getenv("SPECULATIVE_WORKERS", "4")),
+    )
@@ -0,0 +1,9 @@
+import pytest
+from trace_replay import ReplayState, load_pipeline
+
+
+@pytest.fixture(scope="session")
+def pipeline():
+    """The assistant module imported with stand-ins for Pinecone and OpenAI, and their replay state"""
+    state = ReplayState([], latency_scale=0)
+    return load_pipeline(state), state
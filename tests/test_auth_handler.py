@@ -0,0 +1,31 @@
+import time
+import pytest
+from auth_handler import AuthHandler
+
+
+@pytest.fixture
+def auth(monkeypatch):
+    monkeypatch.setenv("ORY_SDK_URL", "http://kratos.test")
+    monkeypatch.setenv("ORY_API_KEY", "test")
+    return AuthHandler()
+
+
+def test_fresh_session_is_served_from_cache(auth):
+    auth._cache_session("token", {"id": "user"})
+    assert auth.validate_session("token") == (True, {"id": "user"})
+
+
+def test_session_cache_is_bounded(auth):
+    auth.session_cache_size = 2
+    for token in ("a", "b", "a", "c"):
+        auth._cache_session(token, {"id": token})
+    assert list(auth._session_cache) == ["a", "c"]
+
+
+def test_expired_sessions_are_evicted_on_write(auth):
+    auth.session_cache_seconds = 0.01
+    auth.stale_session_seconds = 0.05
+    auth._cache_session("old", {"id": "old"})
+    time.sleep(0.06)
+    auth._cache_session("new", {"id": "new"})
+    assert list(auth._session_cache) == ["new"]
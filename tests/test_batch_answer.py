@@ -0,0 +1,44 @@
+import time
+import pytest
+
+
+@pytest.fixture
+def batch_answer(pipeline):
+    import batch_answer
+    return batch_answer
+
+
+class RecordingEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+
+def test_embed_dedupes_by_normalized_text_but_embeds_the_original(batch_answer):
+    answerer = batch_answer.BatchAnswerer(workers=1)
+    answerer.space = type("Space", (), {"embeddings": RecordingEmbeddings()})()
+    answerer._embed(["What is  Visionnaire?", "what is visionnaire?", "Pricing?"])
+    answerer._embed(["WHAT IS VISIONNAIRE?"])
+    assert answerer.space.embeddings.calls == [["What is  Visionnaire?", "Pricing?"]]
+    assert answerer._embedding_cache["what is visionnaire?"] == [21.0]
+    assert answerer.stats["embedded"] == 2
+
+
+def test_rate_limiter_waits_for_tokens(batch_answer):
+    limiter = batch_answer.RateLimiter(requests_per_minute=6000, tokens_per_minute=600)
+    limiter.acquire(600)
+    started = time.monotonic()
+    limiter.acquire(6)  # 6 tokens refill in 0.6s
+    assert time.monotonic() - started >= 0.5
+    assert limiter.waited_seconds > 0
+
+
+def test_rate_limiter_pause_blocks_every_caller(batch_answer):
+    limiter = batch_answer.RateLimiter(requests_per_minute=6000, tokens_per_minute=60000)
+    limiter.pause(0.2)
+    started = time.monotonic()
+    limiter.acquire(1)
+    assert time.monotonic() - started >= 0.15
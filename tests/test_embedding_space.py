@@ -0,0 +1,85 @@
+import os
+import pytest
+import embedding_space
+from embedding_space import SpaceResolver, space_config, write_migration_state, DUAL_WRITE, FINISHED
+
+
+class FakeIndex:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakePinecone:
+    def __init__(self, existing):
+        self.existing = set(existing)
+        self.created = []
+
+    def Index(self, name):
+        if name not in self.existing:
+            raise LookupError(name)
+        return FakeIndex(name)
+
+    def create_index(self, name, spec, dimension, metric):
+        self.created.append(name)
+        self.existing.add(name)
+
+
+@pytest.fixture
+def setup(monkeypatch, tmp_path):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(embedding_space, "MIGRATION_CHECK_SECONDS", 0)
+    monkeypatch.setattr(embedding_space, "PineconeVectorStore", lambda index, embeddings, key: None)
+    source = space_config("old", "text-embedding-ada-002")
+    target = space_config("new", "text-embedding-3-small", 512)
+    return source, target, str(tmp_path / "state.json")
+
+
+def state(source, target, phase):
+    return {"source": source, "target": target, "phase": phase, "backfill": {}}
+
+
+def test_dual_write_reads_source_and_writes_both(setup):
+    source, target, path = setup
+    write_migration_state(state(source, target, DUAL_WRITE), path)
+    resolver = SpaceResolver(FakePinecone(["old", "new"]), source, state_path=path)
+    assert resolver.read_space().name == "old"
+    assert [s.name for s in resolver.write_spaces()] == ["old", "new"]
+
+
+def test_missing_target_is_not_created_and_skipped(setup):
+    source, target, path = setup
+    write_migration_state(state(source, target, DUAL_WRITE), path)
+    pc = FakePinecone(["old"])
+    resolver = SpaceResolver(pc, source, state_path=path)
+    assert [s.name for s in resolver.write_spaces()] == ["old"]
+    assert pc.created == []
+
+
+def test_default_index_is_created(setup):
+    source, _, path = setup
+    pc = FakePinecone([])
+    assert SpaceResolver(pc, source, state_path=path).read_space().name == "old"
+    assert pc.created == ["old"]
+
+
+def test_finished_target_survives_state_removal(setup):
+    source, target, path = setup
+    write_migration_state(state(source, target, FINISHED), path)
+    resolver = SpaceResolver(FakePinecone(["old", "new"]), source, state_path=path)
+    assert resolver.read_space().name == "new"
+    os.remove(path)
+    assert resolver.read_space().name == "new"
+    assert [s.name for s in resolver.write_spaces()] == ["new"]
+
+
+def test_restart_with_target_as_default(setup):
+    _, target, path = setup
+    resolver = SpaceResolver(FakePinecone(["new"]), target, state_path=path)
+    assert resolver.read_space().name == "new"
+
+
+def test_fixed_size_model_rejects_other_dimensions():
+    assert space_config("idx", "text-embedding-ada-002", 1536)["dimensions"] == 1536
+    with pytest.raises(ValueError):
+        space_config("idx", "text-embedding-ada-002", 512)
+    assert space_config("idx", "text-embedding-3-small", 512)["dimensions"] == 512
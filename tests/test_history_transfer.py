@@ -0,0 +1,58 @@
+import gzip
+import json
+import time
+import random
+import argparse
+import pytest
+import history_transfer
+from history_transfer import import_history, read_checkpoint
+
+
+class SlowIndex:
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.ids = []
+
+    def upsert(self, vectors, namespace):
+        time.sleep(random.uniform(0, 0.02))
+        if self.fail_on in (v["id"] for v in vectors):
+            raise RuntimeError("upsert failed")
+        self.ids.extend(v["id"] for v in vectors)
+
+
+def write_export(path, count):
+    with gzip.open(path, "wt", encoding="utf-8") as out:
+        for i in range(count):
+            record = {"id": str(i), "values": [0.0], "metadata": {"user_id": "u", "human_message": "hi"}}
+            out.write(json.dumps(record) + "\n")
+
+
+def run_import(monkeypatch, path, index):
+    monkeypatch.setattr(history_transfer, "get_index", lambda name, dimension=None: index)
+    monkeypatch.setattr(history_transfer, "make_embeddings", lambda config: None)
+    monkeypatch.setattr(history_transfer.time, "sleep", lambda seconds: None)
+    import_history(argparse.Namespace(file=str(path), index="test", namespace="", dimension=None,
+                                      batch_size=3, workers=4, reembed=False, restart=False))
+
+
+def test_import_checkpoints_every_line(monkeypatch, tmp_path):
+    path = tmp_path / "chats.ndjson.gz"
+    write_export(path, 20)
+    index = SlowIndex()
+    run_import(monkeypatch, path, index)
+    assert sorted(index.ids, key=int) == [str(i) for i in range(20)]
+    assert read_checkpoint(f"{path}.checkpoint") == 20
+
+
+def test_checkpoint_stops_before_a_failed_batch(monkeypatch, tmp_path):
+    path = tmp_path / "chats.ndjson.gz"
+    write_export(path, 20)
+    with pytest.raises(RuntimeError):
+        run_import(monkeypatch, path, SlowIndex(fail_on="7"))
+    # Lines 7-9 were one batch; the checkpoint must never move past it
+    assert read_checkpoint(f"{path}.checkpoint") <= 6
+
+    index = SlowIndex()
+    run_import(monkeypatch, path, index)
+    assert "7" in index.ids
+    assert read_checkpoint(f"{path}.checkpoint") == 20
@@ -0,0 +1,166 @@
+import time
+import pytest
+from resilience import CircuitBreaker, DeadlineExceeded
+from model_router import ModelRouter, ModelStats
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeLLM:
+    def __init__(self, name, error=None):
+        self.name = name
+        self.error = error
+        self.calls = 0
+
+    def invoke(self, prompt_text):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return FakeResponse(f"answer from {self.name}")
+
+
+@pytest.fixture
+def make_router(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+
+    def make(fast=("fast-a", "fast-b"), strong=("strong-b",), **kwargs):
+        router = ModelRouter(list(fast), list(strong), **kwargs)
+        # Whitespace token counts keep the tests independent of tiktoken downloads
+        router.count_tokens = lambda text, model: len(text.split())
+        for endpoint in router.endpoints:
+            endpoint.llm = FakeLLM(endpoint.name)
+        return router
+    return make
+
+
+def names(endpoints):
+    return [e.name for e in endpoints]
+
+
+def record(endpoint, latency, success=True, count=5):
+    for _ in range(count):
+        endpoint.stats.record(latency, success)
+
+
+def test_simple_turn_prefers_fastest_fast_model(make_router):
+    router = make_router()
+    record(router.endpoints[0], 2.0)
+    record(router.endpoints[1], 0.5)
+    ordered, reason, _ = router.route("short prompt", "What is the price?")
+    assert reason == "simple"
+    assert names(ordered) == ["fast-b", "fast-a", "strong-b"]
+
+
+def test_complex_turn_prefers_strong_models(make_router):
+    router = make_router()
+    ordered, reason, _ = router.route("prompt", "Why is it slow? Can you explain the trade-offs?")
+    assert reason == "complex"
+    assert names(ordered)[0] == "strong-b"
+
+
+def test_large_prompt_counts_as_complex(make_router):
+    router = make_router(complex_tokens=10)
+    _, reason, prompt_tokens = router.route("word " * 20, "hi")
+    assert reason == "complex"
+    assert prompt_tokens == 20
+
+
+def test_degraded_model_is_tried_last(make_router):
+    router = make_router(max_p95_seconds=1.0)
+    record(router.endpoints[0], 5.0)
+    ordered, _, _ = router.route("prompt", "hi")
+    assert names(ordered)[-1] == "fast-a"
+    assert not router.is_healthy(router.endpoints[0])
+
+
+def test_open_breaker_marks_model_unhealthy(make_router):
+    router = make_router()
+    router.endpoints[0].breaker.state = CircuitBreaker.OPEN
+    router.endpoints[0].breaker.opened_at = time.monotonic()
+    assert not router.is_healthy(router.endpoints[0])
+
+
+def test_degraded_model_recovers_when_samples_expire(make_router):
+    router = make_router(max_p95_seconds=1.0, sample_max_age=0.05)
+    record(router.endpoints[0], 5.0)
+    assert not router.is_healthy(router.endpoints[0])
+    time.sleep(0.06)
+    assert router.is_healthy(router.endpoints[0])
+    ordered, _, _ = router.route("prompt", "hi")
+    assert names(ordered)[0] == "fast-a"
+
+
+def test_model_with_open_breaker_gets_a_trial_after_reset(make_router):
+    router = make_router(fast=("fast-a", "fast-b"), strong=())
+    fast_a, fast_b = router.endpoints
+    fast_a.breaker.reset_timeout = 0.05
+    fast_a.breaker.state = CircuitBreaker.OPEN
+    fast_a.breaker.opened_at = time.monotonic()
+    record(fast_b, 2.0)
+    assert router.invoke("prompt", "hi", timeout=5) == "answer from fast-b"
+    assert fast_a.llm.calls == 0
+
+    time.sleep(0.06)
+    assert router.is_healthy(fast_a)
+    for _ in range(5):
+        router.invoke("prompt", "hi", timeout=5)
+    assert fast_a.llm.calls > 0
+    assert fast_a.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_stats_window_and_error_rate():
+    stats = ModelStats(window=4)
+    for latency, success in [(1, True), (2, False), (3, True), (4, False), (5, True)]:
+        stats.record(latency, success)
+    assert stats.latencies == [2, 3, 4, 5]
+    assert stats.error_rate() == 0.5
+    assert stats.p95() == 5
+
+
+def test_invoke_fails_over_and_records_stats(make_router):
+    router = make_router(fast=("fast-a",), strong=("strong-b",))
+    router.endpoints[0].llm.error = RuntimeError("boom")
+    assert router.invoke("prompt", "hi", timeout=5) == "answer from strong-b"
+    assert router.endpoints[0].stats.outcomes == [False]
+    assert router.endpoints[1].stats.outcomes == [True]
+    metrics = router.metrics()
+    assert metrics["decisions"] == {"fast-a:simple": 1}
+    assert metrics["failovers"] == {"strong-b": 1}
+    assert metrics["models"]["fast-a"]["error_rate"] == 1.0
+
+
+def test_invoke_raises_last_error_when_all_fail(make_router):
+    router = make_router(fast=("fast-a",), strong=())
+    router.endpoints[0].llm.error = RuntimeError("boom")
+    with pytest.raises(RuntimeError):
+        router.invoke("prompt", "hi", timeout=5)
+
+
+def test_invoke_without_budget_does_not_call_models(make_router):
+    router = make_router(fast=("fast-a",), strong=())
+    with pytest.raises(DeadlineExceeded):
+        router.invoke("prompt", "hi", timeout=0)
+    assert router.endpoints[0].llm.calls == 0
+    assert router.endpoints[0].breaker.failures == 0
+
+
+def rate_limit_error():
+    import httpx
+    import openai
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    return openai.RateLimitError("slow down", response=httpx.Response(429, request=request), body=None)
+
+
+def test_rate_limits_do_not_count_against_model_health(make_router):
+    router = make_router(fast=("fast-a",), strong=())
+    endpoint = router.endpoints[0]
+    endpoint.breaker.failure_threshold = 2
+    endpoint.llm.error = rate_limit_error()
+    for _ in range(3):
+        with pytest.raises(type(endpoint.llm.error)):
+            router.invoke("prompt", "hi", timeout=5)
+    assert endpoint.breaker.state == CircuitBreaker.CLOSED
+    assert endpoint.stats.outcomes == []
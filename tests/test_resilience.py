@@ -0,0 +1,203 @@
+import time
+import threading
+import pytest
+from resilience import (
+    Deadline, DeadlineExceeded, CircuitOpenError, BulkheadFullError, CircuitBreaker, breaker_from_env
+)
+
+
+def fail():
+    raise ValueError("down")
+
+
+def test_deadline_budget_is_capped_by_remaining_time():
+    deadline = Deadline(0.5)
+    assert deadline.budget(10) <= 0.5
+    assert deadline.budget(0.1) == 0.1
+    assert not deadline.expired()
+
+
+def test_expired_deadline_has_no_budget():
+    deadline = Deadline(0)
+    assert deadline.expired()
+    assert deadline.budget(5) == 0
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            breaker.call(fail)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: "ok")
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+    with pytest.raises(ValueError):
+        breaker.call(fail)
+    assert breaker.call(lambda: "ok") == "ok"
+    with pytest.raises(ValueError):
+        breaker.call(fail)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_trial_closes_or_reopens():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+    with pytest.raises(ValueError):
+        breaker.call(fail)
+    time.sleep(0.06)
+    with pytest.raises(ValueError):
+        breaker.call(fail)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.06)
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_allows_a_single_trial():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+    with pytest.raises(ValueError):
+        breaker.call(fail)
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+
+def test_zero_budget_is_not_a_failure():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=60)
+    called = []
+    for _ in range(3):
+        with pytest.raises(DeadlineExceeded):
+            breaker.call(called.append, 1, timeout=0)
+    assert called == []
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+
+
+def test_timeout_counts_as_failure():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=60)
+    with pytest.raises(DeadlineExceeded):
+        breaker.call(time.sleep, 0.2, timeout=0.01)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_ignored_errors_do_not_open_the_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=60)
+    with pytest.raises(ValueError):
+        breaker.call(fail, ignore=(ValueError,))
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_hung_dependency_only_fills_its_own_bulkhead():
+    release = threading.Event()
+    slow = CircuitBreaker("slow", failure_threshold=10, max_concurrent=2)
+    fast = CircuitBreaker("fast", max_concurrent=2)
+    try:
+        for _ in range(2):
+            with pytest.raises(DeadlineExceeded):
+                slow.call(release.wait, timeout=0.01)
+        with pytest.raises(BulkheadFullError):
+            slow.call(lambda: "ok", timeout=1)
+        # Another dependency still gets a thread straight away
+        started = time.monotonic()
+        assert fast.call(lambda: "ok", timeout=1) == "ok"
+        assert time.monotonic() - started < 0.5
+    finally:
+        release.set()
+
+
+def test_bulkhead_slot_is_freed_when_the_call_returns():
+    release = threading.Event()
+    breaker = CircuitBreaker("test", failure_threshold=10, max_concurrent=1)
+    with pytest.raises(DeadlineExceeded):
+        breaker.call(release.wait, timeout=0.01)
+    release.set()
+    time.sleep(0.05)
+    assert breaker.call(lambda: "ok", timeout=1) == "ok"
+
+
+def test_breaker_from_env(monkeypatch):
+    monkeypatch.setenv("TEST_BREAKER_FAILURES", "3")
+    monkeypatch.setenv("TEST_BREAKER_RESET_SECONDS", "7")
+    monkeypatch.setenv("TEST_MAX_CONCURRENT", "2")
+    breaker = breaker_from_env("test", "TEST")
+    assert breaker.failure_threshold == 3
+    assert breaker.reset_timeout == 7
+    assert breaker.bulkhead.max_concurrent == 2
+
+
+def test_full_bulkhead_is_not_a_failure():
+    release = threading.Event()
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=60, max_concurrent=1)
+    try:
+        with pytest.raises(DeadlineExceeded):
+            breaker.call(release.wait, timeout=0.01)
+        for _ in range(5):
+            with pytest.raises(BulkheadFullError):
+                breaker.call(lambda: "ok", timeout=1)
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.failures == 1
+    finally:
+        release.set()
+
+
+def test_concurrent_successes_beyond_the_bulkhead_keep_it_closed():
+    breaker = CircuitBreaker("test", failure_threshold=5, reset_timeout=60, max_concurrent=8)
+    results = []
+
+    def worker():
+        try:
+            results.append(breaker.call(time.sleep, 0.1, timeout=1))
+        except BulkheadFullError:
+            results.append("full")
+
+    threads = [threading.Thread(target=worker) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert "full" in results
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_full_bulkhead_releases_the_half_open_trial():
+    release = threading.Event()
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05, max_concurrent=1)
+    try:
+        with pytest.raises(DeadlineExceeded):
+            breaker.call(release.wait, timeout=0.01)
+        time.sleep(0.06)
+        with pytest.raises(BulkheadFullError):
+            breaker.call(lambda: "ok", timeout=1)
+        assert breaker.state == CircuitBreaker.OPEN
+    finally:
+        release.set()
+
+
+def test_late_success_does_not_close_an_open_breaker():
+    release = threading.Event()
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=60)
+    results = []
+    slow = threading.Thread(target=lambda: results.append(breaker.call(release.wait)))
+    slow.start()
+    time.sleep(0.02)
+    with pytest.raises(ValueError):
+        breaker.call(fail)
+    assert breaker.state == CircuitBreaker.OPEN
+    release.set()
+    slow.join()
+    assert results == [True]
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_is_open_honours_the_reset_timeout():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+    assert not breaker.is_open()
+    with pytest.raises(ValueError):
+        breaker.call(fail)
+    assert breaker.is_open()
+    time.sleep(0.06)
+    assert not breaker.is_open()
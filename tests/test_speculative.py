@@ -0,0 +1,112 @@
+import time
+import threading
+import pytest
+
+
+class FakeSpace:
+    class embeddings:
+        @staticmethod
+        def embed_query(text):
+            return [float(len(text))]
+
+
+@pytest.fixture
+def fetches(pipeline, monkeypatch):
+    import speculative
+    calls = {"history": [], "retrieval": [], "release": threading.Event()}
+    calls["release"].set()
+
+    def retrieve(embedding, space=None):
+        calls["retrieval"].append(embedding)
+        calls["release"].wait(5)
+        return f"context for {embedding[0]:.0f} chars"
+
+    monkeypatch.setattr(speculative, "get_user_chat_history", calls["history"].append)
+    monkeypatch.setattr(speculative, "spaces", type("Spaces", (), {"read_space": lambda self: FakeSpace()})())
+    monkeypatch.setattr(speculative, "retrieve_context_by_vector", retrieve)
+    yield calls
+    calls["release"].set()
+
+
+@pytest.fixture
+def prefetcher(fetches):
+    import speculative
+    return speculative.SpeculativePrefetcher(debounce_seconds=0.02, min_chars=5, match_ratio=0.9, ttl_seconds=60)
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.005)
+
+
+def test_drafts_are_debounced(prefetcher, fetches):
+    for draft in ("What", "What is", "What is the", "What is the price"):
+        prefetcher.update_draft("s", "u", draft)
+    wait_for(lambda: fetches["retrieval"])
+    time.sleep(0.05)
+    assert fetches["retrieval"] == [[17.0]]
+    assert fetches["history"] == ["u"]
+
+
+def test_matching_draft_is_reused(prefetcher, fetches):
+    prefetcher.update_draft("s", "u", "What is the price")
+    wait_for(lambda: fetches["retrieval"])
+    assert prefetcher.take("s", "what is the  price?", timeout=1) == "context for 17 chars"
+    assert len(fetches["retrieval"]) == 1
+    # A prefetch is used once
+    assert prefetcher.take("s", "What is the price", timeout=1) is None
+
+
+def test_non_matching_draft_returns_none(prefetcher, fetches):
+    prefetcher.update_draft("s", "u", "What is the price")
+    wait_for(lambda: fetches["retrieval"])
+    assert prefetcher.take("s", "Tell me about your team", timeout=1) is None
+
+
+def test_stale_draft_is_cancelled(prefetcher, fetches):
+    fetches["release"].clear()
+    prefetcher.update_draft("s", "u", "What is the price")
+    wait_for(lambda: fetches["retrieval"] and "s" in prefetcher._prefetches)
+    stale = prefetcher._prefetches["s"]
+    prefetcher.update_draft("s", "u", "Who founded the company")
+    wait_for(lambda: prefetcher._prefetches["s"] is not stale)
+    assert stale.cancelled.is_set()
+    fetches["release"].set()
+    assert prefetcher.take("s", "Who founded the company", timeout=1) == "context for 23 chars"
+
+
+def test_timeout_returns_empty_context_without_retrieving_again(prefetcher, fetches):
+    fetches["release"].clear()
+    prefetcher.update_draft("s", "u", "What is the price")
+    wait_for(lambda: fetches["retrieval"])
+    started = time.monotonic()
+    assert prefetcher.take("s", "What is the price", timeout=0.05) == ""
+    assert time.monotonic() - started < 0.5
+    assert len(fetches["retrieval"]) == 1
+
+
+def test_empty_context_skips_retrieval_in_predict(pipeline, monkeypatch):
+    assistant, _ = pipeline
+    retrievals = []
+    monkeypatch.setattr(assistant, "retrieve_context", lambda *args, **kwargs: retrievals.append(args) or "")
+    history, _ = assistant.predict("What is the price", [], "replay-none", context="")
+    assert retrievals == []
+    assert len(history) == 1
+
+
+def test_expired_prefetch_is_not_used(prefetcher, fetches):
+    prefetcher.ttl_seconds = 0.01
+    prefetcher.update_draft("s", "u", "What is the price")
+    wait_for(lambda: fetches["retrieval"])
+    time.sleep(0.02)
+    assert prefetcher.take("s", "What is the price", timeout=1) is None
+
+
+def test_discard_cancels_pending_work(prefetcher, fetches):
+    prefetcher.update_draft("s", "u", "What is the price")
+    prefetcher.discard("s")
+    time.sleep(0.05)
+    assert fetches["retrieval"] == []
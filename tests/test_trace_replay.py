@@ -0,0 +1,87 @@
+from trace_replay import (
+    ReplayState, StandInIndex, StandInVectorStore, StandInChat, failed, summarize, replay
+)
+
+
+def make_trace(trace_id, message=None, stages=None, metrics=None, **responses):
+    return {
+        "trace_id": trace_id,
+        "started_at": "2026-10-19T10:00:00",
+        "stages": stages or [{"name": "generation", "offset": 0.0, "seconds": 0.05, "ok": True}],
+        "metrics": {"message_chars": 20, "history_items": 4, "history_chars": 40,
+                    "context_chars": 30, "answer_chars": 10, **(metrics or {})},
+        "responses": {"message": message, **responses},
+        "total_seconds": 0.1,
+    }
+
+
+def use_traces(state, traces):
+    state.__dict__.update(ReplayState(traces, latency_scale=0).__dict__)
+
+
+def test_stand_ins_find_their_trace():
+    trace = make_trace("a", message="What is Visionnaire?", context="recorded context", answer="recorded")
+    state = ReplayState([trace], latency_scale=0)
+    assert state.by_user["replay-a"] is trace
+
+    matches = StandInIndex(state).query(filter={"user_id": "replay-a"}).matches
+    assert len(matches) == 2
+    assert all(len(m.metadata["human_message"]) == 10 for m in matches)
+
+    docs = StandInVectorStore(state).similarity_search("What is Visionnaire?")
+    assert [d.page_content for d in docs] == ["recorded context"]
+
+    prompt_text = "<ctx>...</ctx>\n------\nWhat is Visionnaire?\nAnswer:\n"
+    assert StandInChat(state).invoke(prompt_text).content == "recorded"
+
+
+def test_redacted_traces_get_filler_of_the_recorded_size():
+    trace = make_trace("b")
+    state = ReplayState([trace], latency_scale=0)
+    assert len(trace["replay_message"]) > 20
+    docs = StandInVectorStore(state).similarity_search(trace["replay_message"])
+    assert len(docs[0].page_content) == 30
+    assert StandInVectorStore(state).similarity_search("unknown") == []
+
+
+def test_failed_stages_are_errors_not_timings():
+    good = make_trace("good")
+    broken = make_trace("broken", stages=[{"name": "generation", "offset": 0.0, "seconds": 0.001, "ok": False}],
+                        metrics={"error": "ConnectionError: no network"})
+    assert failed(broken) and not failed(good)
+    summary = summarize([good, broken])
+    assert summary["generation"] == {"count": 1, "errors": 1, "p50": 0.05, "p95": 0.05}
+    assert summary["total"]["errors"] == 1
+
+
+def test_retrieval_fallback_counts_as_error():
+    trace = make_trace("fallback", stages=[{"name": "retrieval", "offset": 0.0, "seconds": 0.0, "ok": True}],
+                       metrics={"retrieval_fallback": True})
+    assert summarize([trace])["retrieval"]["errors"] == 1
+
+
+def test_replay_runs_offline(pipeline):
+    assistant, state = pipeline
+    traces = [make_trace(f"r{i}", message=f"Question number {i}?", answer=f"answer {i}") for i in range(3)]
+    use_traces(state, traces)
+    results = replay(traces, assistant, state, speed=0, max_gap=1, concurrency=2)
+    assert len(results) == 3
+    assert not any(failed(t) for t in results)
+    assert {t["metrics"]["source_trace"] for t in results} == {"r0", "r1", "r2"}
+    assert summarize(results)["generation"]["count"] == 3
+
+
+def test_replay_reports_failed_requests(pipeline, monkeypatch):
+    assistant, state = pipeline
+
+    def unavailable(prompt_text, **kwargs):
+        raise ConnectionError("no network")
+
+    for endpoint in assistant.router.endpoints:
+        monkeypatch.setattr(endpoint.llm, "invoke", unavailable)
+    traces = [make_trace("f0", message="Will this fail?")]
+    use_traces(state, traces)
+    result, = replay(traces, assistant, state, speed=0, max_gap=1, concurrency=1)
+    assert failed(result)
+    assert "no network" in result["metrics"]["error"]
+    assert summarize([result])["generation"]["count"] == 0
@@ -0,0 +1,84 @@
+import json
+import pytest
+import tracing
+
+
+@pytest.fixture
+def collected(monkeypatch):
+    traces = []
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE_RATE", 1.0)
+    tracing.set_sink(traces.append)
+    yield traces
+    tracing.set_sink(None)
+
+
+def test_disabled_without_sink_or_dir(monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_DIR", "")
+    with tracing.trace_request("hello") as trace:
+        assert trace is None
+        tracing.record(ignored=True)
+        with tracing.stage("noop"):
+            pass
+
+
+def test_stages_metrics_and_redaction(monkeypatch, collected):
+    monkeypatch.setattr(tracing, "TRACE_REDACT", True)
+    with tracing.trace_request("secret question", "user-1"):
+        with tracing.stage("history"):
+            tracing.record_content("history", [{"type": "human", "content": "abc"}])
+        tracing.record(prompt_tokens=12)
+    trace, = collected
+    assert [s["name"] for s in trace["stages"]] == ["history"]
+    assert trace["stages"][0]["ok"]
+    assert trace["metrics"]["message_chars"] == len("secret question")
+    assert trace["metrics"]["history_items"] == 1
+    assert trace["metrics"]["prompt_tokens"] == 12
+    assert trace["responses"] == {"message": None, "history": None}
+    assert trace["user"] != "user-1"
+    assert "secret question" not in json.dumps(trace)
+
+
+def test_contents_kept_without_redaction(monkeypatch, collected):
+    monkeypatch.setattr(tracing, "TRACE_REDACT", False)
+    with tracing.trace_request("question"):
+        tracing.record_content("answer", "the answer")
+    assert collected[0]["responses"] == {"message": "question", "answer": "the answer"}
+
+
+def test_failed_stage_is_marked(collected):
+    with pytest.raises(ValueError):
+        with tracing.trace_request("question"):
+            with tracing.stage("generation"):
+                raise ValueError("boom")
+    assert collected[0]["stages"][0]["ok"] is False
+
+
+def test_sampling(monkeypatch, collected):
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE_RATE", 0.0)
+    with tracing.trace_request("question") as trace:
+        assert trace is None
+    assert collected == []
+
+
+def test_nested_trace_joins_the_outer_one(collected):
+    with tracing.trace_request("question") as outer:
+        with tracing.stage("validate_session"):
+            pass
+        with tracing.trace_request("question", "user-1") as inner:
+            assert inner is outer
+            with tracing.stage("history"):
+                pass
+    trace, = collected
+    assert [s["name"] for s in trace["stages"]] == ["validate_session", "history"]
+    assert trace["user"] is not None
+
+
+def test_written_traces_can_be_read_back(monkeypatch, tmp_path):
+    monkeypatch.setattr(tracing, "TRACE_DIR", str(tmp_path))
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE_RATE", 1.0)
+    for message in ("first", "second"):
+        with tracing.trace_request(message):
+            pass
+    path, = tmp_path.iterdir()
+    traces = list(tracing.read_traces(str(path)))
+    assert [t["metrics"]["message_chars"] for t in traces] == [5, 6]
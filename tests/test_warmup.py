@@ -0,0 +1,112 @@
+import time
+import threading
+from collections import OrderedDict
+import pytest
+
+
+@pytest.fixture
+def assistant(pipeline, monkeypatch):
+    assistant, _ = pipeline
+    monkeypatch.setattr(assistant, "_history_cache", OrderedDict())
+    return assistant
+
+
+@pytest.fixture
+def warmup(assistant, monkeypatch):
+    import warmup
+    monkeypatch.setattr(warmup, "warm_up_clients", lambda: None)
+    return warmup
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.005)
+
+
+def test_warmup_fills_the_history_cache(warmup, assistant, monkeypatch):
+    monkeypatch.setattr(warmup, "prefetch_user_history",
+                        lambda user_id: assistant._cache_history(user_id, ["turn"]))
+    manager = warmup.WarmupManager(max_concurrent=1)
+    manager.start("token", "user")
+    wait_for(lambda: assistant._cached_history("user") is not None)
+    assert assistant._cached_history("user") == ["turn"]
+
+
+def test_logout_during_history_query_leaves_no_cache(warmup, assistant, monkeypatch):
+    querying = threading.Event()
+    release = threading.Event()
+    finished = threading.Event()
+
+    def slow_prefetch(user_id):
+        querying.set()
+        release.wait(5)
+        assistant._cache_history(user_id, ["turn"])
+
+    monkeypatch.setattr(warmup, "prefetch_user_history", slow_prefetch)
+    original_clear = warmup.clear_user_history_cache
+
+    def clear(user_id):
+        original_clear(user_id)
+        if release.is_set():
+            finished.set()
+
+    monkeypatch.setattr(warmup, "clear_user_history_cache", clear)
+    manager = warmup.WarmupManager(max_concurrent=1)
+    manager.start("token", "user")
+    assert querying.wait(2)
+    manager.cancel("token")
+    release.set()
+    assert finished.wait(2)
+    assert assistant._cached_history("user") is None
+
+
+def test_warmups_respect_the_concurrency_limit(warmup, monkeypatch):
+    running = []
+    peak = []
+    lock = threading.Lock()
+    done = threading.Semaphore(0)
+
+    def prefetch(user_id):
+        with lock:
+            running.append(user_id)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(user_id)
+        done.release()
+
+    monkeypatch.setattr(warmup, "prefetch_user_history", prefetch)
+    manager = warmup.WarmupManager(max_concurrent=2)
+    for i in range(6):
+        manager.start(f"token-{i}", f"user-{i}")
+    for _ in range(6):
+        assert done.acquire(timeout=2)
+    assert max(peak) == 2
+
+
+def test_history_cache_expires(assistant, monkeypatch):
+    monkeypatch.setattr(assistant, "HISTORY_CACHE_SECONDS", 0.05)
+    assistant._cache_history("old", ["a"])
+    assert assistant._cached_history("old") == ["a"]
+    time.sleep(0.06)
+    assert assistant._cached_history("old") is None
+    # Expired entries are evicted on the next write, not kept until logout
+    assistant._cache_history("new", ["b"])
+    assert list(assistant._history_cache) == ["new"]
+
+
+def test_history_cache_is_bounded(assistant, monkeypatch):
+    monkeypatch.setattr(assistant, "HISTORY_CACHE_SIZE", 2)
+    for user_id in ("a", "b", "a", "c"):
+        assistant._cache_history(user_id, [user_id])
+    # "a" was written again after "b", so "b" is the oldest and goes first
+    assert list(assistant._history_cache) == ["a", "c"]
+
+
+def test_clear_user_history_cache(assistant):
+    assistant._cache_history("user", ["a"])
+    assistant.clear_user_history_cache("user")
+    assert assistant._cached_history("user") is None
@@ -0,0 +1,331 @@
+"""
+Replay recorded chat traces against local stand-in dependencies.
+
+    python trace_replay.py traces/traces-20261019.ndjson.gz --speed 10 --output run.json
+    python trace_replay.py traces/traces-20261019.ndjson.gz --baseline run.json
+
+Each trace is sent through the real predict pipeline at its original arrival
+time (divided by --speed). Pinecone, OpenAI and Kratos are replaced by stand-ins
+that wait as long as the recorded stage took and return the recorded response,
+or filler of the recorded size when the trace was redacted. The per-stage
+timings of the run are summarised and, with --baseline, compared against an
+earlier run. Failed stages and requests are counted as errors instead of
+timing samples; the exit code is 1 when a replayed request failed or a stage
+got slower than --tolerance.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from types import SimpleNamespace
+from datetime import datetime
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage
+import tracing
+
+FILLER = "lorem ipsum dolor sit amet consectetur adipiscing elit "
+
+
+def filler(chars):
+    return (FILLER * (chars // len(FILLER) + 1))[:chars]
+
+
+def stage_seconds(trace, name):
+    return sum(s["seconds"] for s in trace["stages"] if s["name"] == name)
+
+
+class ReplayState:
+    def __init__(self, traces, latency_scale):
+        """Look up the trace a stand-in call belongs to, by replay user ID or by question"""
+        self.latency_scale = latency_scale
+        self.by_user = {}
+        self.by_message = {}
+        for trace in traces:
+            trace["replay_user"] = f"replay-{trace['trace_id']}"
+            message = trace["responses"].get("message")
+            if message is None:
+                message = f"[{trace['trace_id']}] " + filler(trace["metrics"].get("message_chars", 0))
+            trace["replay_message"] = message
+            self.by_user[trace["replay_user"]] = trace
+            self.by_message[message.strip()] = trace
+
+    def wait(self, trace, name):
+        if trace is not None:
+            time.sleep(stage_seconds(trace, name) * self.latency_scale)
+
+
+class StandInIndex:
+    def __init__(self, state):
+        self.state = state
+
+    def query(self, vector=None, filter=None, top_k=None, include_metadata=True, **kwargs):
+        trace = self.state.by_user.get((filter or {}).get("user_id"))
+        self.state.wait(trace, "history")
+        return SimpleNamespace(matches=self._history_matches(trace))
+
+    def _history_matches(self, trace):
+        if trace is None:
+            return []
+        messages = trace["responses"].get("history")
+        if messages is None:
+            items = trace["metrics"].get("history_items", 0)
+            chars = trace["metrics"].get("history_chars", 0) // max(items, 1)
+            messages = [{"type": "human" if i % 2 == 0 else "ai", "content": filler(chars)}
+                        for i in range(items)]
+        matches = []
+        for i in range(0, len(messages), 2):
+            pair = messages[i:i + 2]
+            matches.append(SimpleNamespace(metadata={
+                "timestamp": f"{i:08d}",
+                "human_message": pair[0]["content"],
+                "ai_message": pair[1]["content"] if len(pair) > 1 else "",
+            }))
+        return matches
+
+    def upsert(self, vectors=None, **kwargs):
+        trace = self.state.by_user.get(vectors[0]["metadata"]["user_id"]) if vectors else None
+        self.state.wait(trace, "store")
+
+    def describe_index_stats(self):
+        return {}
+
+
+class StandInPinecone:
+    def __init__(self, index):
+        self.index = index
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def Index(self, name):
+        return self.index
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+
+class StandInVectorStore:
+    def __init__(self, state):
+        self.state = state
+
+    def similarity_search(self, query, k=4, **kwargs):
+        trace = self.state.by_message.get(query.strip())
+        self.state.wait(trace, "retrieval")
+        if trace is None or not trace["metrics"].get("context_chars"):
+            return []
+        context = trace["responses"].get("context")
+        if context is None:
+            context = filler(trace["metrics"]["context_chars"])
+        return [Document(page_content=context)]
+
+
+class StandInEmbeddings:
+    def __init__(self, dimension):
+        self.dimension = dimension
+
+    def embed_query(self, text):
+        return [0.0] * self.dimension
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+class StandInChat:
+    def __init__(self, state):
+        self.state = state
+
+    def invoke(self, prompt_text, **kwargs):
+        # The question is the last section of the prompt template
+        question = prompt_text.rsplit("------\n", 1)[-1].rsplit("Answer:", 1)[0]
+        trace = self.state.by_message.get(question.strip())
+        self.state.wait(trace, "generation")
+        if trace is None:
+            return AIMessage(content="")
+        answer = trace["responses"].get("answer")
+        if answer is None:
+            answer = filler(trace["metrics"].get("answer_chars", 0))
+        return AIMessage(content=answer)
+
+
+def load_pipeline(state):
+    """Import the assistant with every external client swapped for a stand-in"""
+    os.environ.setdefault("OPENAI_API_KEY", "replay")
+    os.environ.setdefault("PINECONE_API_KEY", "replay")
+    os.environ.setdefault("PINECONE_INDEX_NAME", "replay")
+    # Replay always reads from the single stand-in index, whatever migration is running
+    os.environ["EMBEDDING_MIGRATION_STATE"] = ""
+    index = StandInIndex(state)
+    vector_store = StandInVectorStore(state)
+    with mock.patch("pinecone.Pinecone", StandInPinecone(index)), \
+            mock.patch("langchain_pinecone.PineconeVectorStore", lambda *args, **kwargs: vector_store):
+        import assistant
+    space = assistant.spaces.read_space()
+    space.index = index
+    space.vector_store = vector_store
+    space.embeddings = StandInEmbeddings(space.dimension)
+    for endpoint in assistant.router.endpoints:
+        endpoint.llm = StandInChat(state)
+    # tiktoken downloads its encodings on first use; roughly four characters per token is enough here
+    assistant.router.count_tokens = lambda text, model: len(text) // 4
+    return assistant
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def failed(trace):
+    """Whether the request errored or had to fall back somewhere"""
+    metrics = trace["metrics"]
+    return ("error" in metrics or metrics.get("retrieval_fallback", False)
+            or any(not s.get("ok", True) for s in trace["stages"]))
+
+
+def summarize(traces):
+    """p50/p95 seconds per stage and for the whole request, over the samples that succeeded"""
+    samples = {"total": []}
+    errors = {"total": 0}
+    for trace in traces:
+        if failed(trace):
+            errors["total"] += 1
+        else:
+            samples["total"].append(trace["total_seconds"])
+        for s in trace["stages"]:
+            samples.setdefault(s["name"], [])
+            errors.setdefault(s["name"], 0)
+            if not s.get("ok", True) or (s["name"] == "retrieval" and trace["metrics"].get("retrieval_fallback")):
+                errors[s["name"]] += 1
+            else:
+                samples[s["name"]].append(s["seconds"])
+    return {
+        name: {"count": len(values), "errors": errors[name], "p50": round(percentile(values, 0.5), 4),
+               "p95": round(percentile(values, 0.95), 4)}
+        for name, values in samples.items()
+    }
+
+
+def print_summary(title, summary):
+    print(title)
+    for name, row in sorted(summary.items()):
+        print(f"  {name:<18} n={row['count']:<6} errors={row.get('errors', 0):<4} "
+              f"p50={row['p50']:.3f}s  p95={row['p95']:.3f}s")
+
+
+def compare(summary, baseline, tolerance):
+    """Print p95 changes against the baseline and return the stages that regressed"""
+    regressions = []
+    print("Comparison with baseline (p95):")
+    for name, row in sorted(summary.items()):
+        if name not in baseline or not baseline[name]["p95"]:
+            continue
+        before = baseline[name]["p95"]
+        change = (row["p95"] - before) / before
+        flag = "  REGRESSION" if change > tolerance else ""
+        print(f"  {name:<18} {before:.3f}s -> {row['p95']:.3f}s ({change:+.1%}){flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def replay(traces, assistant, state, speed, max_gap, concurrency):
+    """Send every trace through predict on its recorded schedule and collect the new traces"""
+    results = []
+    lock = threading.Lock()
+
+    def collect(data):
+        with lock:
+            results.append(data)
+
+    def run(trace):
+        with tracing.trace_request(trace["replay_message"], trace["replay_user"]):
+            tracing.record(source_trace=trace["trace_id"])
+            try:
+                with tracing.stage("validate_session"):
+                    state.wait(trace, "validate_session")
+                with tracing.stage("predict"):
+                    assistant.predict(trace["replay_message"], [], trace["replay_user"])
+            except Exception as e:
+                print(f"Replay of trace {trace['trace_id']} failed: {e}")
+                tracing.record(error=f"{type(e).__name__}: {e}")
+
+    tracing.TRACE_SAMPLE_RATE = 1.0
+    tracing.set_sink(collect)
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            started = time.monotonic()
+            offset = 0.0
+            previous = None
+            for trace in traces:
+                arrived = datetime.fromisoformat(trace["started_at"])
+                if previous is not None and speed > 0:
+                    offset += min((arrived - previous).total_seconds(), max_gap) / speed
+                previous = arrived
+                delay = started + offset - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(run, trace)
+    finally:
+        tracing.set_sink(None)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded chat traces offline")
+    parser.add_argument("traces", nargs="+", help="Trace files written with TRACE_DIR set")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Arrival pacing multiplier; 1 is original pacing, 0 sends everything at once")
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="Multiplier for the recorded dependency latencies")
+    parser.add_argument("--max-gap", type=float, default=5.0, help="Longest pause between two requests, in seconds")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests replayed at the same time")
+    parser.add_argument("--output", help="Write the run summary and traces to this JSON file")
+    parser.add_argument("--baseline", help="Summary JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed p95 slowdown, e.g. 0.1 for 10%%")
+    args = parser.parse_args()
+
+    traces = [trace for path in args.traces for trace in tracing.read_traces(path)]
+    traces.sort(key=lambda t: t["started_at"])
+    if not traces:
+        print("No traces to replay")
+        return 0
+    print(f"Replaying {len(traces)} traces")
+
+    state = ReplayState(traces, args.latency_scale)
+    assistant = load_pipeline(state)
+    results = replay(traces, assistant, state, args.speed, args.max_gap, args.concurrency)
+
+    print_summary("Recorded:", summarize(traces))
+    summary = summarize(results)
+    print_summary("Replayed:", summary)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": summary, "traces": results}, f, indent=2)
+        print(f"Saved replay results to {args.output}")
+
+    exit_code = 0
+    failures = [t for t in results if failed(t)]
+    if failures:
+        first_error = failures[0]["metrics"].get("error", "a stage failed or fell back")
+        print(f"{len(failures)} of {len(results)} replayed requests failed, first error: {first_error}")
+        exit_code = 1
+    if len(results) < len(traces):
+        print(f"{len(traces) - len(results)} traces were not replayed")
+        exit_code = 1
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)["summary"]
+        if compare(summary, baseline, args.tolerance):
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
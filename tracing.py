@@ -0,0 +1,160 @@
+"""
+Opt-in request tracing for the chat pipeline.
+
+Set TRACE_DIR to record one compact JSON trace per chat request into
+TRACE_DIR/traces-YYYYMMDD.ndjson.gz. A trace holds per-stage timings, the
+sizes and token counts of the prompt, history, context and answer, and the
+dependency responses. Message, history, context and answer contents are left
+out unless TRACE_REDACT=0. trace_replay.py replays these files offline.
+"""
+import os
+import json
+import gzip
+import time
+import uuid
+import random
+import hashlib
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRACE_DIR = os.getenv("TRACE_DIR", "")
+TRACE_REDACT = os.getenv("TRACE_REDACT", "1") != "0"
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1"))
+
+_current = contextvars.ContextVar("current_trace", default=None)
+_sink = None
+_write_lock = threading.Lock()
+
+
+def set_sink(sink):
+    """Send finished traces to sink(trace_dict) instead of TRACE_DIR; None restores the default"""
+    global _sink
+    _sink = sink
+
+
+def enabled() -> bool:
+    return _sink is not None or bool(TRACE_DIR)
+
+
+def _hash(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:16]
+
+
+class Trace:
+    def __init__(self, message: str, user_id: str = None):
+        self.started = time.monotonic()
+        self.data = {
+            "trace_id": uuid.uuid4().hex[:16],
+            "started_at": datetime.utcnow().isoformat(),
+            "user": None,
+            "stages": [],
+            "metrics": {},
+            "responses": {},
+        }
+        self.set_user(user_id)
+        self.record_content("message", message)
+
+    def set_user(self, user_id: str):
+        if user_id:
+            self.data["user"] = _hash(user_id)
+
+    def record_content(self, name: str, content):
+        """Keep the size of a payload, and the payload itself unless redacting"""
+        if isinstance(content, list):
+            self.data["metrics"][f"{name}_items"] = len(content)
+            self.data["metrics"][f"{name}_chars"] = sum(len(item.get("content", "")) for item in content)
+        else:
+            self.data["metrics"][f"{name}_chars"] = len(content or "")
+        self.data["responses"][name] = None if TRACE_REDACT else content
+
+
+def current() -> Trace:
+    """The trace of the request being handled, or None when not tracing"""
+    return _current.get()
+
+
+@contextmanager
+def trace_request(message: str, user_id: str = None):
+    """Trace everything inside the block as one request; nested blocks join the outer trace"""
+    existing = _current.get()
+    if existing is not None:
+        existing.set_user(user_id)
+        yield existing
+        return
+    if not enabled() or random.random() >= TRACE_SAMPLE_RATE:
+        yield None
+        return
+
+    trace = Trace(message, user_id)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+        trace.data["total_seconds"] = round(time.monotonic() - trace.started, 4)
+        _emit(trace.data)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a pipeline stage of the current trace"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.monotonic()
+    ok = True
+    try:
+        yield
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        trace.data["stages"].append({
+            "name": name,
+            "offset": round(started - trace.started, 4),
+            "seconds": round(time.monotonic() - started, 4),
+            "ok": ok,
+        })
+
+
+def record(**values):
+    """Add metrics such as token counts or the chosen model to the current trace"""
+    trace = _current.get()
+    if trace is not None:
+        trace.data["metrics"].update(values)
+
+
+def record_content(name: str, content):
+    trace = _current.get()
+    if trace is not None:
+        trace.record_content(name, content)
+
+
+def _emit(data: dict):
+    try:
+        if _sink is not None:
+            _sink(data)
+            return
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        path = os.path.join(TRACE_DIR, f"traces-{datetime.utcnow():%Y%m%d}.ndjson.gz")
+        with _write_lock:
+            # Each append adds a gzip member; readers see one continuous stream
+            with gzip.open(path, "at", encoding="utf-8") as out:
+                out.write(json.dumps(data, separators=(",", ":")) + "\n")
+    except Exception as e:
+        print(f"Error writing trace: {e}")
+
+
+def read_traces(path: str):
+    """Yield the traces stored in a trace file"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as source:
+        for line in source:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,67 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from assistant import warm_up_clients, prefetch_user_history, clear_user_history_cache
+
+load_dotenv()
+
+
+class WarmupManager:
+    def __init__(self, max_concurrent: int = 4):
+        """
+        Warm up a user's context in the background after login, so their first
+        message does not pay for cold clients and the history query.
+        At most max_concurrent warm-ups run at once; the rest wait in the queue.
+        """
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="warmup")
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def start(self, session_token: str, user_id: str):
+        """Schedule a warm-up for the session, replacing any earlier one"""
+        if not session_token or not user_id:
+            return
+        self.cancel(session_token, clear_cache=False)
+        cancelled = threading.Event()
+        future = self._pool.submit(self._run, user_id, cancelled)
+        with self._lock:
+            self._tasks[session_token] = (user_id, future, cancelled)
+        future.add_done_callback(lambda f: self._forget(session_token, f))
+        print(f"Scheduled warm-up for user: {user_id}")
+
+    def cancel(self, session_token: str, clear_cache: bool = True):
+        """Stop the session's warm-up and, by default, drop what it cached"""
+        with self._lock:
+            task = self._tasks.pop(session_token, None)
+        if not task:
+            return
+        user_id, future, cancelled = task
+        cancelled.set()
+        future.cancel()
+        if clear_cache:
+            clear_user_history_cache(user_id)
+        print(f"Cancelled warm-up for user: {user_id}")
+
+    def _forget(self, session_token, future):
+        with self._lock:
+            task = self._tasks.get(session_token)
+            if task and task[1] is future:
+                del self._tasks[session_token]
+
+    def _run(self, user_id, cancelled):
+        if cancelled.is_set():
+            return
+        warm_up_clients()
+        if cancelled.is_set():
+            return
+        prefetch_user_history(user_id)
+        if cancelled.is_set():
+            # Logged out while the query was running
+            clear_user_history_cache(user_id)
+            return
+        print(f"Warm-up finished for user: {user_id}")
+
+
+def warmup_manager_from_env() -> WarmupManager:
+    return WarmupManager(max_concurrent=int(os.getenv("WARMUP_CONCURRENCY", "4")))